@@ -0,0 +1,261 @@
+import asyncio
+import math
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import aiohttp
+
+import http_client
+import rate_limit
+import stream_selector
+from config import headers
+from downloading import DownloadManager, Segment
+
+
+class AsyncDownloadEngine:
+    """基于 asyncio 的下载引擎，在同一个事件循环中复用连接并发下载多个文件
+
+    Args:
+        max_concurrency (int): 所有文件共享的最大并发分段请求数
+        per_host_limit (int): 每个主机的最大并发连接数
+        write_buffer_size (int): 每个分段攒够多少字节后写一次磁盘
+    """
+
+    def __init__(self, max_concurrency=16, per_host_limit=8, write_buffer_size=1024 * 1024):
+        self.max_concurrency = max_concurrency
+        self.per_host_limit = per_host_limit
+        self.write_buffer_size = write_buffer_size
+        self._session = None
+        self._global_semaphore = None
+        self._host_semaphores = {}
+
+    async def __aenter__(self):
+        settings = http_client.load_network_config()
+        connect_timeout, read_timeout = settings['timeout']
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency,
+                                         limit_per_host=self.per_host_limit)
+        timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers)
+        self._global_semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._host_semaphores = {}
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._session.close()
+        self._session = None
+
+    def _host_semaphore(self, url):
+        """获取指定主机的信号量，限制单个主机上的并发请求"""
+        host = urlsplit(url).hostname
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_semaphores[host]
+
+    async def _get_file_size(self, manager):
+        """获取文件大小，并记录续传校验用的 ETag / Last-Modified"""
+        try:
+            async with self._session.head(manager.url, allow_redirects=True) as response:
+                response.raise_for_status()
+                manager._record_validators(response.headers)
+                if 'content-length' in response.headers:
+                    return int(response.headers['content-length'])
+            async with self._session.get(manager.url, allow_redirects=True) as response:
+                response.raise_for_status()
+                manager._record_validators(response.headers)
+                if 'content-length' in response.headers:
+                    return int(response.headers['content-length'])
+        except aiohttp.ClientError:
+            pass
+        return None
+
+    async def _download_part(self, manager, segment):
+        """下载文件的一部分，写入与 DownloadManager 相同格式的分段文件
+
+        失败时按 rate_limit.RetryPolicy 退避后从已写入的位置继续下载。
+        """
+        policy = rate_limit.get_policy()
+        limiter = rate_limit.get_limiter(manager.url)
+        try:
+            f = manager._open_segment_file(segment)
+        except OSError as e:
+            print(f"\n下载部分 {segment.start}-{segment.end} 失败: {e}")
+            return False
+
+        # 数据先攒在内存中，攒够 write_buffer_size 再交给线程写盘，避免同步写文件阻塞事件循环
+        buffer = bytearray()
+
+        async def flush():
+            if buffer:
+                # 写入成功后才清空缓冲区，写入失败时下一次 flush 会重试同样的数据
+                await asyncio.to_thread(f.write, bytes(buffer))
+                segment.written += len(buffer)
+                buffer.clear()
+
+        with f:
+            for attempt in range(policy.attempts):
+                headers_copy = headers.copy()
+                headers_copy['Range'] = f'bytes={segment.position}-{segment.end}'
+                retry_after = None
+                error = None
+                try:
+                    async with self._global_semaphore, self._host_semaphore(manager.url):
+                        if limiter is not None:
+                            await limiter.acquire_async()
+                        async with self._session.get(manager.url, headers=headers_copy) as response:
+                            response.raise_for_status()
+                            async for chunk in response.content.iter_chunked(manager.chunk_size):
+                                length = segment.claim(len(chunk))
+                                buffer += chunk[:length]
+                                manager.downloaded += length
+                                if len(buffer) >= self.write_buffer_size:
+                                    await flush()
+                except aiohttp.ClientResponseError as e:
+                    error = e
+                    if e.status not in policy.retry_statuses:
+                        print(f"\n下载部分 {segment.start}-{segment.end} 失败: {error}")
+                        return False
+                    retry_after = policy.retry_after(e.headers)
+                except Exception as e:
+                    error = e
+                # 重试从 segment.position 继续，之前收到的数据必须先落盘
+                try:
+                    await flush()
+                except OSError as e:
+                    print(f"\n下载部分 {segment.start}-{segment.end} 失败: {e}")
+                    return False
+                if segment.remaining() <= 0:
+                    return True
+                print(f"\n下载部分 {segment.start}-{segment.end} 失败: {error or '连接提前关闭'}")
+                if attempt + 1 < policy.attempts:
+                    await asyncio.sleep(policy.backoff(attempt, retry_after))
+            return False
+
+    async def _journal_loop(self, manager, segments, interval=1.0):
+        """定期写入续传日志，直到任务被取消"""
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(manager._save_journal, segments)
+
+    async def fetch(self, url, filename=None, chunk_size=8192, threads=1, resume=False):
+        """异步下载单个文件，参数与 downloading.download 一致
+
+        Returns:
+            bool: 下载是否成功
+        """
+        manager = DownloadManager(url, filename, chunk_size, threads, resume)
+        start_time = time.time()
+
+        manager.total_size = await self._get_file_size(manager)
+        if not manager.total_size:
+            print(f"无法获取文件大小，跳过: {manager.filename}")
+            return False
+
+        resume_downloaded, completed_ranges = manager._get_resume_info()
+        manager.completed_ranges = completed_ranges
+        manager.downloaded = resume_downloaded
+
+        # 把缺失的区间切成不超过 threads 份大小相近的分段
+        gaps = manager._missing_ranges(completed_ranges)
+        part_size = math.ceil(sum(end - start + 1 for start, end in gaps) / threads)
+        segments = []
+        for gap_start, gap_end in gaps:
+            for start in range(gap_start, gap_end + 1, part_size):
+                segments.append(Segment(start, min(start + part_size - 1, gap_end)))
+
+        journal_task = asyncio.create_task(self._journal_loop(manager, segments))
+        try:
+            results = await asyncio.gather(*(self._download_part(manager, segment)
+                                             for segment in segments))
+        finally:
+            journal_task.cancel()
+            await asyncio.to_thread(manager._save_journal, segments)
+
+        if not all(results):
+            print(f"✗ 下载失败或部分失败: {manager.filename}")
+            return False
+
+        # 合并属于磁盘IO，放到线程中执行以免阻塞事件循环
+        merged = await asyncio.to_thread(manager._finish_parts, segments, Path(manager.filename))
+        if merged:
+            manager.journal.remove()
+            total_time = time.time() - start_time
+            stream_selector.record_throughput(manager.downloaded - resume_downloaded, total_time)
+            print(f"✓ {manager.filename} 下载完成! 总耗时: {total_time:.2f}s, "
+                  f"平均速度: {manager.downloaded / total_time / 1024 / 1024:.2f} MB/s")
+        return merged
+
+    async def download_many(self, items):
+        """并发下载多个文件
+
+        Args:
+            items: 由 (url, filename) 元组或 fetch 参数字典组成的列表
+
+        Returns:
+            list: 与 items 顺序对应的下载结果
+        """
+        tasks = []
+        for item in items:
+            if isinstance(item, dict):
+                tasks.append(self.fetch(**item))
+            else:
+                tasks.append(self.fetch(*item))
+        return await asyncio.gather(*tasks)
+
+
+class AsyncDownloadManager:
+    """asyncio 版本的下载管理器，接口与 DownloadManager 保持一致"""
+
+    def __init__(self, url, filename=None, chunk_size=8192, threads=4, resume=False,
+                 max_concurrency=16, per_host_limit=8):
+        self.url = url
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.threads = threads
+        self.resume = resume
+        self.max_concurrency = max_concurrency
+        self.per_host_limit = per_host_limit
+
+    async def download_async(self):
+        """在当前事件循环中执行下载"""
+        async with AsyncDownloadEngine(self.max_concurrency, self.per_host_limit) as engine:
+            return await engine.fetch(self.url, self.filename, self.chunk_size, self.threads, self.resume)
+
+    def download(self):
+        """执行下载"""
+        return asyncio.run(self.download_async())
+
+
+def download(url, filename=None, chunk_size=8192, threads=1, resume=False):
+    """
+    异步版下载函数，签名与 downloading.download 一致
+
+    Args:
+        url: 要下载的文件URL
+        filename: 保存的文件名（可选，默认为URL中的文件名）
+        chunk_size: 下载块大小（字节）
+        threads: 并发分段数（默认为1）
+        resume: 是否启用断点续传（默认False）
+
+    Returns:
+        bool: 下载是否成功
+    """
+    return AsyncDownloadManager(url, filename, chunk_size, threads, resume).download()
+
+
+def download_many(items, max_concurrency=16, per_host_limit=8):
+    """在同一个事件循环中批量下载多个文件
+
+    Args:
+        items: 由 (url, filename) 元组或 download 参数字典组成的列表
+        max_concurrency: 全局最大并发分段请求数
+        per_host_limit: 每个主机的最大并发连接数
+
+    Returns:
+        list: 与 items 顺序对应的下载结果
+    """
+    async def run():
+        async with AsyncDownloadEngine(max_concurrency, per_host_limit) as engine:
+            return await engine.download_many(items)
+
+    return asyncio.run(run())
@@ -0,0 +1,141 @@
+"""对比线程版 DownloadManager 与 asyncio 版下载引擎的性能
+
+在本地启动一个支持 Range 请求的 HTTP 服务器，模拟批量下载多首歌曲的场景：
+    python benchmark_download.py --files 20 --size 8 --threads 4
+"""
+import argparse
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+
+import async_downloading
+import downloading
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """返回固定大小的伪数据，支持 Range 请求，并按 latency/bandwidth 模拟网络"""
+
+    protocol_version = "HTTP/1.1"
+    file_size = 8 * 1024 * 1024
+    latency = 0.05
+    bandwidth = 4 * 1024 * 1024
+    payload = b""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _parse_range(self):
+        range_header = self.headers.get("Range")
+        if not range_header:
+            return 0, self.file_size - 1, False
+        match = re.match(r"bytes=(\d+)-(\d*)", range_header)
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else self.file_size - 1
+        return start, min(end, self.file_size - 1), True
+
+    def _send_headers(self, start, end, partial):
+        self.send_response(206 if partial else 200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        if partial:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{self.file_size}")
+        self.end_headers()
+
+    def do_HEAD(self):
+        start, end, partial = self._parse_range()
+        self._send_headers(start, end, partial)
+
+    def do_GET(self):
+        start, end, partial = self._parse_range()
+        time.sleep(self.latency)
+        self._send_headers(start, end, partial)
+        block = 64 * 1024
+        position = start
+        try:
+            while position <= end:
+                length = min(block, end - position + 1)
+                offset = position % len(self.payload)
+                data = (self.payload[offset:] + self.payload)[:length]
+                self.wfile.write(data)
+                position += length
+                if self.bandwidth:
+                    time.sleep(length / self.bandwidth)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def start_server(file_size, latency, bandwidth):
+    """在后台线程中启动 Range 服务器，返回 (server, base_url)"""
+    RangeRequestHandler.file_size = file_size
+    RangeRequestHandler.latency = latency
+    RangeRequestHandler.bandwidth = bandwidth
+    RangeRequestHandler.payload = os.urandom(1024 * 1024)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def bench_threaded(items, threads):
+    """线程版：逐个文件下载，每个文件单独创建线程池"""
+    start = time.perf_counter()
+    results = [downloading.download(url, filename, threads=threads) for url, filename in items]
+    return time.perf_counter() - start, results
+
+
+def bench_async(items, threads, max_concurrency, per_host_limit):
+    """asyncio 版：所有文件在同一个事件循环中并发下载"""
+    start = time.perf_counter()
+    results = async_downloading.download_many(
+        [{"url": url, "filename": filename, "threads": threads} for url, filename in items],
+        max_concurrency=max_concurrency, per_host_limit=per_host_limit)
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=20, help="模拟的歌曲数量")
+    parser.add_argument("--size", type=float, default=8, help="单个文件大小（MB）")
+    parser.add_argument("--threads", type=int, default=4, help="每个文件的分段数")
+    parser.add_argument("--latency", type=float, default=0.05, help="每个请求的首字节延迟（秒）")
+    parser.add_argument("--bandwidth", type=float, default=4, help="每个连接的带宽上限（MB/s，0为不限）")
+    parser.add_argument("--max-concurrency", type=int, default=32, help="asyncio 引擎的全局并发上限")
+    parser.add_argument("--per-host", type=int, default=32, help="asyncio 引擎的单主机并发上限")
+    args = parser.parse_args()
+
+    file_size = int(args.size * 1024 * 1024)
+    server, base_url = start_server(file_size, args.latency, int(args.bandwidth * 1024 * 1024))
+
+    # DownloadManager 使用相对路径 ./temp，在临时目录中运行以免污染工作区
+    work_dir = Path(tempfile.mkdtemp(prefix="bench_download_"))
+    old_cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        total_mb = args.files * file_size / 1024 / 1024
+        thread_items = [(f"{base_url}/thread_{i}.mp4", f"thread_{i}.mp4") for i in range(args.files)]
+        async_items = [(f"{base_url}/async_{i}.mp4", f"async_{i}.mp4") for i in range(args.files)]
+
+        thread_time, thread_results = bench_threaded(thread_items, args.threads)
+        async_time, async_results = bench_async(async_items, args.threads, args.max_concurrency, args.per_host)
+
+        print("=" * 60)
+        print(f"{args.files} 个文件 × {args.size} MB，每个文件 {args.threads} 个分段")
+        print(f"线程版  : {thread_time:8.2f}s  {total_mb / thread_time:8.2f} MB/s  "
+              f"成功 {sum(bool(r) for r in thread_results)}/{args.files}")
+        print(f"asyncio : {async_time:8.2f}s  {total_mb / async_time:8.2f} MB/s  "
+              f"成功 {sum(bool(r) for r in async_results)}/{args.files}")
+        print(f"加速比  : {thread_time / async_time:.2f}x")
+    finally:
+        os.chdir(old_cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""在注入故障的本地服务器上检验限流和重试
+
+服务器按给定概率返回 412 风控、-352 风控码、503（带 Retry-After），或在传输中途断开连接。
+依次运行 API 请求、线程版下载和 asyncio 版下载，检查结果是否完整、请求速率是否受限，
+有请求失败、文件不完整或超出限流时以非零状态退出（--no-retry 作为对照，只输出结果）：
+    python benchmark_retry.py
+    python benchmark_retry.py --fault-rate 0.3 --drop-rate 0.2 --api-rate 10
+    python benchmark_retry.py --no-retry
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+
+import async_downloading
+import downloading
+import http_client
+import rate_limit
+
+
+class FaultInjectingHandler(BaseHTTPRequestHandler):
+    """/x/web-interface/view 返回 JSON，其他路径返回支持 Range 的伪数据，按概率注入故障"""
+
+    protocol_version = "HTTP/1.1"
+    file_size = 4 * 1024 * 1024
+    payload = b""
+    fault_rate = 0.2
+    drop_rate = 0.1
+    retry_after = "0"
+    stats = Counter()
+    stats_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def _send_error_response(self, status):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        if status == 503:
+            self.send_header("Retry-After", self.retry_after)
+        self.end_headers()
+
+    def _send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _parse_range(self):
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if not match:
+            return 0, self.file_size - 1, False
+        end = int(match.group(2)) if match.group(2) else self.file_size - 1
+        return int(match.group(1)), min(end, self.file_size - 1), True
+
+    def _send_file_headers(self, start, end, partial):
+        self.send_response(206 if partial else 200)
+        self.send_header("Content-Type", "audio/mp4")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        if partial:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{self.file_size}")
+        self.end_headers()
+
+    def do_HEAD(self):
+        start, end, partial = self._parse_range()
+        self._send_file_headers(start, end, partial)
+
+    def do_GET(self):
+        if self.path.startswith("/x/web-interface/view"):
+            self._count("api")
+            if random.random() < self.fault_rate:
+                if random.random() < 0.5:
+                    self._count("api_412")
+                    self._send_error_response(412)
+                else:
+                    self._count("api_352")
+                    self._send_json({"code": -352, "message": "-352"})
+                return
+            self._send_json({"code": 0, "data": {"bvid": "BV1xx411c7mD"}})
+            return
+
+        self._count("range")
+        if random.random() < self.fault_rate:
+            self._count("range_503")
+            self._send_error_response(503)
+            return
+        start, end, partial = self._parse_range()
+        self._send_file_headers(start, end, partial)
+        # 中途断开：只发送一部分数据后关闭连接
+        stop = end + 1
+        if random.random() < self.drop_rate:
+            self._count("range_dropped")
+            stop = start + (end - start + 1) // 2
+        try:
+            position = start
+            while position < stop:
+                length = min(64 * 1024, stop - position)
+                offset = position % len(self.payload)
+                self.wfile.write((self.payload[offset:] + self.payload)[:length])
+                position += length
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        if stop <= end:
+            self.close_connection = True
+
+
+def start_server():
+    FaultInjectingHandler.payload = os.urandom(1024 * 1024)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FaultInjectingHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+
+def expected_bytes(size):
+    payload = FaultInjectingHandler.payload
+    return (payload * (size // len(payload) + 1))[:size]
+
+
+def bench_api(url, requests_count):
+    """连续请求 API，返回 (成功数, 耗时)"""
+    start = time.perf_counter()
+    succeeded = 0
+    for _ in range(requests_count):
+        try:
+            response = http_client.get(url)
+            if response.status_code == 200 and response.json().get("code") == 0:
+                succeeded += 1
+        except Exception:
+            pass
+    return succeeded, time.perf_counter() - start
+
+
+def count_intact(filenames, size):
+    """与服务器数据逐字节一致的文件数量"""
+    expected = expected_bytes(size)
+    return sum(1 for name in filenames if Path(name).exists() and Path(name).read_bytes() == expected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=8, help="下载的文件数量")
+    parser.add_argument("--size", type=float, default=4, help="单个文件大小（MB）")
+    parser.add_argument("--threads", type=int, default=4, help="每个文件的分段数")
+    parser.add_argument("--api-requests", type=int, default=30, help="API 请求次数")
+    parser.add_argument("--api-rate", type=float, default=20, help="API 限流（每秒请求数）")
+    parser.add_argument("--fault-rate", type=float, default=0.2, help="返回 412/-352/503 的概率")
+    parser.add_argument("--drop-rate", type=float, default=0.1, help="传输中途断开的概率")
+    parser.add_argument("--attempts", type=int, default=8, help="最多尝试次数")
+    parser.add_argument("--no-retry", action="store_true", help="关闭重试作为对照")
+    args = parser.parse_args()
+
+    FaultInjectingHandler.file_size = int(args.size * 1024 * 1024)
+    FaultInjectingHandler.fault_rate = args.fault_rate
+    FaultInjectingHandler.drop_rate = args.drop_rate
+    server, port = start_server()
+
+    # 本地地址默认不限流：localhost 视为 API，127.0.0.1 视为 CDN
+    rate_limit.host_classes["localhost"] = "api"
+    rate_limit.host_classes["127.0.0.1"] = "cdn"
+    rate_limit.configure(limits={"view": (args.api_rate, 1), "cdn": (200, 50)},
+                         policy=rate_limit.RetryPolicy(attempts=1 if args.no_retry else args.attempts,
+                                                       base_delay=0.05, max_delay=0.5))
+
+    work_dir = Path(tempfile.mkdtemp(prefix="bench_retry_"))
+    old_cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        api_ok, api_time = bench_api(f"http://localhost:{port}/x/web-interface/view?bvid=BV1xx411c7mD",
+                                     args.api_requests)
+
+        thread_names = [f"thread_{i}.m4a" for i in range(args.files)]
+        start = time.perf_counter()
+        for name in thread_names:
+            downloading.download(f"http://127.0.0.1:{port}/{name}", name, threads=args.threads,
+                                 progress_sinks=[])
+        thread_time = time.perf_counter() - start
+        thread_ok = count_intact(thread_names, FaultInjectingHandler.file_size)
+
+        async_names = [f"async_{i}.m4a" for i in range(args.files)]
+        start = time.perf_counter()
+        async_downloading.download_many([{"url": f"http://127.0.0.1:{port}/{name}", "filename": name,
+                                          "threads": args.threads} for name in async_names])
+        async_time = time.perf_counter() - start
+        async_ok = count_intact(async_names, FaultInjectingHandler.file_size)
+
+        stats = FaultInjectingHandler.stats
+        print("=" * 60)
+        print(f"Injected: {stats['api_412']} x 412, {stats['api_352']} x -352, "
+              f"{stats['range_503']} x 503, {stats['range_dropped']} dropped connections")
+        print(f"API     : {api_ok}/{args.api_requests} ok, {stats['api']} requests in {api_time:.2f}s "
+              f"({stats['api'] / api_time:.1f} req/s, limit {args.api_rate:g})")
+        print(f"threaded: {thread_ok}/{args.files} files intact in {thread_time:.2f}s")
+        print(f"asyncio : {async_ok}/{args.files} files intact in {async_time:.2f}s")
+
+        if args.no_retry:
+            return
+        errors = []
+        if api_ok < args.api_requests:
+            errors.append(f"{args.api_requests - api_ok} API requests failed")
+        # 令牌桶的突发容量为 1，请求数不能超过 速率 × 耗时 + 1
+        if stats['api'] > args.api_rate * api_time + 1:
+            errors.append(f"{stats['api']} API requests in {api_time:.2f}s exceed the limit of {args.api_rate:g}/s")
+        if thread_ok < args.files:
+            errors.append(f"{args.files - thread_ok} threaded downloads are incomplete")
+        if async_ok < args.files:
+            errors.append(f"{args.files - async_ok} asyncio downloads are incomplete")
+        if errors:
+            raise SystemExit("\n".join(errors))
+    finally:
+        os.chdir(old_cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
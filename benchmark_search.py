@@ -0,0 +1,63 @@
+"""对比 HTML 搜索页解析与 JSON 搜索接口解析的性能
+
+先录制一次真实的搜索结果作为样本，之后的基准测试只使用本地样本，不访问网络：
+    python benchmark_search.py --record 晴天
+    python benchmark_search.py --iterations 200
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from song_search import HtmlSearchBackend, JsonSearchBackend
+
+fixtures_dir = Path("./benchmark_fixtures")
+
+
+def record(keyword):
+    """用两个后端分别请求一次搜索结果并保存为样本"""
+    fixtures_dir.mkdir(exist_ok=True)
+    html_text = HtmlSearchBackend().fetch(keyword)
+    (fixtures_dir / "search.html").write_text(html_text, encoding="utf-8")
+    payload = JsonSearchBackend().fetch(keyword)
+    (fixtures_dir / "search.json").write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+    print(f"Recorded fixtures for '{keyword}' into {fixtures_dir}")
+
+
+def bench(label, parse, raw, iterations):
+    """重复解析同一个样本，返回单次解析的平均耗时和结果数量"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        candidates = parse(raw)
+    elapsed = (time.perf_counter() - start) / iterations
+    print(f"{label:<5}: {len(raw.encode('utf-8')) / 1024:8.1f} KB  "
+          f"{elapsed * 1000:8.3f} ms/parse  {len(candidates)} results")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--record", metavar="KEYWORD", help="录制指定关键词的搜索结果样本")
+    parser.add_argument("--iterations", type=int, default=100, help="每个后端的解析次数")
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record)
+        return
+
+    html_path = fixtures_dir / "search.html"
+    json_path = fixtures_dir / "search.json"
+    if not html_path.exists() or not json_path.exists():
+        print("No fixtures found, please run: python benchmark_search.py --record <keyword>")
+        return
+
+    html_text = html_path.read_text(encoding="utf-8")
+    json_text = json_path.read_text(encoding="utf-8")
+    html_time = bench("html", HtmlSearchBackend().parse, html_text, args.iterations)
+    # JSON 的解码也计入解析时间
+    json_time = bench("json", lambda raw: JsonSearchBackend().parse(json.loads(raw)), json_text, args.iterations)
+    print(f"json is {html_time / json_time:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
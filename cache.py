@@ -0,0 +1,117 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteCache:
+    """两级缓存：内存中的 LRU 作为前端，sqlite 文件作为持久层
+
+    每条记录带有写入时间，超过 ttl 秒即视为过期；持久层按最近访问时间做 LRU 淘汰，
+    最多保留 max_entries 条。值以 JSON 保存，因此只能缓存可以 JSON 序列化的数据。
+
+    Args:
+        path (Path): sqlite 数据库文件路径
+        table (str): 表名，同一个数据库中可以存放多个缓存
+        ttl (float): 过期时间（秒）
+        max_entries (int): 持久层最多保留的记录数
+        memory_entries (int): 内存层最多保留的记录数
+    """
+
+    def __init__(self, path, table, ttl, max_entries=5000, memory_entries=256):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 多个线程共用一个连接，访问由 self.lock 串行化
+        self.connection = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+            self.connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table} (accessed_at)")
+
+    def _remember(self, key, value, created_at):
+        self.memory[key] = (value, created_at)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def _expired(self, created_at, now):
+        return now - created_at > self.ttl
+
+    def get(self, key):
+        """读取缓存，不存在或已过期时返回 None"""
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None and not self._expired(entry[1], now):
+                self.memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return entry[0]
+
+            row = self.connection.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None or self._expired(row[1], now):
+                self.memory.pop(key, None)
+                self.misses += 1
+                return None
+
+            with self.connection:
+                self.connection.execute(
+                    f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            value = json.loads(row[0])
+            self._remember(key, value, row[1])
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """写入缓存，并在超出容量时淘汰最久未访问的记录"""
+        now = time.time()
+        data = json.dumps(value, ensure_ascii=False)
+        with self.lock:
+            self._remember(key, value, now)
+            with self.connection:
+                self.connection.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?)", (key, data, now, now))
+                self.connection.execute(
+                    f"DELETE FROM {self.table} WHERE created_at < ?", (now - self.ttl,))
+                self.connection.execute(
+                    f"DELETE FROM {self.table} WHERE key IN ("
+                    f"SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,))
+
+    def delete(self, key):
+        """删除一条记录"""
+        with self.lock:
+            self.memory.pop(key, None)
+            with self.connection:
+                self.connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def stats(self):
+        """命中统计"""
+        return {'hits': self.hits, 'memory_hits': self.memory_hits, 'misses': self.misses}
+
+    def log_stats(self):
+        """把命中统计写入日志"""
+        logger.info("%s cache: %d hits (%d from memory), %d misses",
+                    self.table, self.hits, self.memory_hits, self.misses)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -1,4 +1,8 @@
+import logging
+import os
 import re
+import time
+from functools import lru_cache
 from pathlib import Path
 
 headers = {
@@ -11,6 +15,86 @@ headers = {
     'Upgrade-Insecure-Requests': '1',
 }
 
+# 网络请求默认参数，可在 config.ini 的 [network] 段中覆盖
+request_timeout = (5, 30)  # (连接超时, 读取超时)，单位：秒
+pool_connections = 4  # 每个主机缓存的连接池数量
+pool_maxsize = 16  # 每个连接池保持的最大keep-alive连接数
+pooled_hosts = [
+    'api.bilibili.com',
+    'search.bilibili.com',
+    'www.bilibili.com',
+    'upos-sz-mirrorcos.bilivideo.com',
+    'upos-sz-mirrorali.bilivideo.com',
+    'upos-sz-mirrorhw.bilivideo.com',
+    'cn-gotcha01.bilivideo.com',
+]
+
+# 各类接口共享的限流（每秒请求数, 最多突发请求数），可在 config.ini 的 [rate_limit] 段中覆盖
+rate_limits = {
+    'search': (1, 3),
+    'view': (5, 10),
+    'playurl': (5, 10),
+    'api': (5, 10),
+    'cdn': (30, 60),
+}
+# 请求失败时的重试策略，可在 config.ini 的 [retry] 段中覆盖
+retry_policy = {
+    'attempts': 5,  # 最多尝试次数（包括第一次）
+    'base_delay': 0.5,  # 第一次重试前的最大等待时间（秒），之后每次翻倍
+    'max_delay': 30.0,  # 单次等待时间的上限（秒）
+}
+
+# 批量处理流水线各阶段的并发数，可在 config.ini 的 [pipeline] 段中覆盖
+pipeline_workers = {
+    'search': 2,
+    'resolve': 4,
+    'download': 3,
+    'transcode': os.cpu_count() or 2,
+}
+pipeline_queue_size = 8  # 阶段之间队列的容量，队列满时上游阶段会等待
+
+# 批量下载的持久化任务队列：程序中断后从每首歌最后完成的阶段继续
+job_queue_path = Path("./jobs/queue.sqlite")
+job_lease = 900  # 领取任务的租约（秒），处理期间每隔 1/3 租约续期一次，领取者退出后超过该时间的任务可被重新领取
+job_url_ttl = 1800  # 保存的下载地址的有效期（秒），超过后重新解析
+batch_processes = 1  # 批量下载的工作进程数，大于 1 时每个进程运行一条流水线，共用同一个任务队列
+
+# 图形界面的下载队列：同时下载的歌曲数，以及每首歌的下载线程数
+gui_download_workers = 3
+gui_download_threads = 4
+
+# 音视频流的选择策略：max_bitrate（最高码率）、size_cap（不超过 stream_max_size 字节）、
+# target_time（以 stream_link_speed 字节/秒的速度在 stream_target_seconds 秒内下载完，
+# stream_link_speed 为 None 时使用本次运行中已完成下载的实测速度）
+stream_policy = 'max_bitrate'
+stream_max_size = None
+stream_target_seconds = None
+stream_link_speed = None
+video_quality = 64  # mp4 下载请求的最高清晰度（qn），16 为 360P，32 为 480P，64 为 720P，实际清晰度由 stream_policy 选择
+stall_timeout = 10  # 下载连接超过该时间（秒）没有收到数据时切换到备用地址
+
+# 搜索后端的尝试顺序：json 为签名的搜索接口，html 为解析搜索网页（备用）
+search_backends = ['json', 'html']
+
+# 本地缓存
+cache_dir = Path("./cache")
+search_cache_ttl = 7 * 24 * 3600  # 搜索结果的有效期（秒）
+search_cache_entries = 5000  # 最多缓存的搜索结果条数
+video_cache_ttl = 24 * 3600  # 视频信息（view 接口）的重新验证周期（秒）
+video_cache_entries = 20000  # 最多缓存的视频信息条数
+
+# 本地媒体库：文件按内容哈希保存，索引记录视频 id 与文件的对应关系
+library_dir = Path("./library")
+library_index = library_dir / "index.sqlite"
+
+# 转码策略，可在 config.ini 的 [transcode] 段中覆盖
+# format 为目标格式（mp3/m4a/opus/ogg/flac），auto 表示保留源音频编码、只换容器
+transcode_format = 'mp3'
+transcode_quality = '0'  # mp3/ogg 的 VBR 质量参数（-q:a）
+transcode_bitrate = '192k'  # aac/opus 的目标码率（-b:a）
+transcode_copy = True  # 源编码可以直接放进目标容器时只做封装转换，不重新编码
+transcode_timeout = 600  # 单个转码任务的超时时间（秒）
+
 char_map = {
     '——': '--',  # 中文破折号 → 两个连字符
     '―': '-',  # 长破折号 → 短横线
@@ -120,10 +204,36 @@ audio_suffix = [
 temp_dir = Path("./temp")
 logging_path = Path("./log")
 
+# char_map 中的单字符替换合并为一张转换表，由 str.translate 一次完成；
+# 多字符的键（如 '——'）在 char_map 中排在前面，先单独替换，结果与逐个 replace 相同
+_multi_char_map = {old: new for old, new in char_map.items() if len(old) > 1}
+_translate_table = str.maketrans({old: new for old, new in char_map.items() if len(old) == 1})
+_illegal_chars_pattern = re.compile(windows_illegal_chars)
+_underscores_pattern = re.compile(r'_+')
+
+
+@lru_cache(maxsize=4096)
 def normalize_filename(filename):
-    for old_char, new_char in char_map.items():
-        filename = filename.replace(old_char, new_char)
-    filename = re.sub(windows_illegal_chars, "_",filename)
-    filename = re.sub(r'_+', '_', filename)
+    for old_chars, new_chars in _multi_char_map.items():
+        filename = filename.replace(old_chars, new_chars)
+    filename = filename.translate(_translate_table)
+    filename = _illegal_chars_pattern.sub("_", filename)
+    filename = _underscores_pattern.sub('_', filename)
     filename = filename.strip(' _.')
-    return filename
\ No newline at end of file
+    return filename
+
+
+def set_logging():
+    """把 INFO 及以上的日志写入 logging_path 下的新文件，已配置过日志时不做任何事
+
+    文件名带有进程号，多进程工作模式下各进程写入各自的日志文件。
+    """
+    if logging.getLogger().handlers:
+        return
+    logging_path.mkdir(exist_ok=True)
+    log_path = logging_path / f"{time.time()}_{os.getpid()}.log"
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+                        datefmt="%Y-%m-%d %H:%M:%S",
+                        filename=log_path,
+                        encoding='utf-8')
\ No newline at end of file
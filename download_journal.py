@@ -0,0 +1,78 @@
+import json
+import os
+import threading
+from urllib.parse import urlsplit
+
+
+class DownloadJournal:
+    """断点续传日志
+
+    以 JSON 保存在 temp 目录中，记录下载的来源标识（URL 路径、ETag、Last-Modified）、
+    文件总大小、写入模式以及每个分段的区间和已写入字节数。每次写入都先写临时文件再原子替换，
+    中途崩溃或被 Ctrl-C 打断时，日志始终是一个完整可用的版本。
+    """
+
+    version = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def identity(url):
+        """URL 标识：CDN 地址中的查询参数（签名、过期时间）每次都会变化，只比较路径"""
+        return urlsplit(url).path
+
+    def load(self):
+        """读取日志，不存在或已损坏时返回 None"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get('version') != self.version:
+            return None
+        return data
+
+    def matches(self, data, url, total_size, etag, last_modified, mode):
+        """判断日志是否属于同一个下载（同一文件、同一版本、同一写入模式）"""
+        if data.get('identity') != self.identity(url):
+            return False
+        if data.get('total_size') != total_size or data.get('mode') != mode:
+            return False
+        # 只有双方都提供校验字段时才比较
+        if etag and data.get('etag') and data['etag'] != etag:
+            return False
+        if last_modified and data.get('last_modified') and data['last_modified'] != last_modified:
+            return False
+        return True
+
+    def save(self, url, total_size, etag, last_modified, mode, segments):
+        """原子地写入日志
+
+        Args:
+            segments: [(start, end, written), ...]，written 为从 start 开始已连续写入的字节数
+        """
+        data = {
+            'version': self.version,
+            'url': url,
+            'identity': self.identity(url),
+            'etag': etag,
+            'last_modified': last_modified,
+            'total_size': total_size,
+            'mode': mode,
+            'segments': [list(segment) for segment in segments],
+        }
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+        with self.lock:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+
+    def remove(self):
+        """下载完成后删除日志"""
+        with self.lock:
+            self.path.unlink(missing_ok=True)
+            self.path.with_name(self.path.name + '.tmp').unlink(missing_ok=True)
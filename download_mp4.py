@@ -1,14 +1,35 @@
 import urllib3
-import requests
 import re
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from generate_params import generate_wrid
 import downloading
+import async_downloading
 import config
+import http_client
+from cache import SqliteCache
+from library import MediaLibrary
+import stream_selector
+
+# DASH 流中 codecs 字段的前缀与 ffmpeg 编码名称的对应关系
+dash_codecs = {
+    'mp4a': 'aac',
+    'fLaC': 'flac',
+    'flac': 'flac',
+    'ec-3': 'eac3',
+    'ac-3': 'ac3',
+    'opus': 'opus',
+}
 
 class download_mp4:
     def __init__(self):
         self.api_url = f"https://api.bilibili.com/x/web-interface/view?bvid="
+        self.aid_api_url = "https://api.bilibili.com/x/web-interface/view?aid="
         self.pattern = r"(?:BV|av|AV)[0-9A-Za-z]{10,}"
+        # 完整的 view 接口响应，同时以 bvid 和 av 号为键保存
+        self.metadata = SqliteCache(config.cache_dir / "cache.sqlite", "video_view",
+                                    ttl=config.video_cache_ttl, max_entries=config.video_cache_entries)
+        self.library = MediaLibrary()
 
     def get_video_id(self,bilibili_url):
         """Extract AV or BV string from bilibili link using regular expressions.
@@ -26,11 +47,99 @@ class download_mp4:
         match = re.search(self.pattern, bilibili_url)
         return match.group(0)
 
+    @staticmethod
+    def _metadata_key(video_id):
+        """BV ids are case sensitive, av ids are stored as "av<number>"."""
+        if video_id[:2].lower() == "av":
+            return "av" + video_id[2:]
+        return video_id
+
+    def get_video_view(self,video_id,refresh=False):
+        """Get the full response of the view api, from the local store when possible.
+
+        Args:
+            video_id (str) :The AV or BV string of the video.
+            refresh (bool) :Ignore the stored copy and ask the api again.
+
+        Returns:
+            dict :The "data" field of the view api, including pages, duration,
+                owner and stat.
+        Raises:
+            RuntimeError :The api returned an error code.
+        """
+        key = self._metadata_key(video_id)
+        if not refresh:
+            view = self.metadata.get(key)
+            if view is not None:
+                return view
+
+        if key.startswith("av"):
+            api_url = self.aid_api_url + key[2:]
+        else:
+            api_url = self.api_url + key
+        json_data = http_client.get(api_url, headers=config.headers,verify=False).json()
+        if json_data.get('code') != 0:
+            raise RuntimeError(f"view api error {json_data.get('code')}: {json_data.get('message')}")
+        view = json_data['data']
+        self.metadata.set(view['bvid'], view)
+        self.metadata.set(f"av{view['aid']}", view)
+        return view
+
+    def resolve_many(self,video_ids,max_in_flight=8):
+        """Resolve the view data of many videos concurrently.
+
+        Args:
+            video_ids (iterable) :BV/AV ids or bilibili urls, duplicates are resolved once.
+            max_in_flight (int) :The maximum number of concurrent api requests.
+
+        Yields:
+            (video_id, view, error) :In order of completion. view is the "data" field of
+                the view api (None on failure), error is the exception (None on success).
+        """
+        pending_ids = []
+        seen = set()
+        for item in video_ids:
+            match = re.search(self.pattern, item)
+            if match is None:
+                yield item, None, ValueError(f"No AV/BV id found in '{item}'")
+                continue
+            key = self._metadata_key(match.group(0))
+            if key in seen:
+                continue
+            seen.add(key)
+            # 本地已有的直接返回，不占用并发名额
+            view = self.metadata.get(key)
+            if view is not None:
+                yield key, view, None
+            else:
+                pending_ids.append(key)
+
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            remaining = iter(pending_ids)
+            in_flight = {}
+
+            def submit_next():
+                for key in remaining:
+                    in_flight[executor.submit(self.get_video_view, key)] = key
+                    return
+
+            for _ in range(max_in_flight):
+                submit_next()
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = in_flight.pop(future)
+                    submit_next()
+                    try:
+                        yield key, future.result(), None
+                    except Exception as e:
+                        yield key, None, e
+
     def get_video_information(self,video_id):
         """Get some specific args.
 
         Args:
-            video_id (str) :The bilibili url.
+            video_id (str) :The AV or BV string of the video.
 
         Returns:
             aid,cid (str) :The specific args of this video.
@@ -39,15 +148,229 @@ class download_mp4:
         Raises:
             None
         """
-        api_url = self.api_url + video_id
-        json_data = requests.get(api_url, headers=config.headers,verify=False).json()
-        aid = json_data['data']['aid']
-        pic = json_data['data']['pic']
-        title = json_data['data']['title']
-        cid = json_data['data']['cid']
+        view = self.get_video_view(video_id)
+        aid = view['aid']
+        pic = view['pic']
+        title = view['title']
+        cid = view['cid']
         return aid,pic,title,cid
 
-    def get_mp4(self,aid,cid,title):
+    def find_in_library(self,video_id,file_format=None):
+        """Find a downloaded copy of a single-page video in the library, without the network.
+
+        The cid of the first page is read from the stored view data. When the video has never
+        been resolved the cid is unknown, and any page of the video matches.
+
+        Args:
+            video_id (str) :The AV or BV string of the video.
+            file_format (str) :The format of the file, None for any format.
+
+        Returns:
+            record (dict) :The library record, None if not found. Always None for multi-P
+                videos, download_all checks each page on its own.
+        Raises:
+            None
+        """
+        key = self._metadata_key(video_id)
+        view = self.metadata.get(key)
+        if view is None:
+            return self.library.lookup(key, file_format=file_format)
+        if len(view.get('pages') or []) > 1:
+            return None
+        return self.library.lookup(key, cid=view['cid'], file_format=file_format)
+
+    def get_parts(self,video_id,include_season=True):
+        """Enumerate every page (P) of a video, and of the other videos in its collection.
+
+        Args:
+            video_id (str) :The AV or BV string of the video.
+            include_season (bool) :Also include the members of the video's ugc_season (collection).
+
+        Returns:
+            parts (list) :Dicts with bvid, aid, cid, page and title, in playlist order.
+                The title of a multi-P video part is "<title> - P<n> <part name>".
+        Raises:
+            RuntimeError :The view api of the given video returned an error code.
+        """
+        view = self.get_video_view(video_id)
+        bvids = [view['bvid']]
+        if include_season and view.get('ugc_season'):
+            for section in view['ugc_season'].get('sections') or []:
+                for episode in section.get('episodes') or []:
+                    if episode.get('bvid') and episode['bvid'] not in bvids:
+                        bvids.append(episode['bvid'])
+
+        views = {view['bvid']: view}
+        for key, member_view, error in self.resolve_many(bvids[1:]):
+            if error is not None:
+                print(f"Failed to get the information of {key}: {error}")
+                continue
+            views[member_view['bvid']] = member_view
+
+        parts = []
+        for bvid in bvids:
+            member_view = views.get(bvid)
+            if member_view is None:
+                continue
+            pages = member_view.get('pages') or [{'cid': member_view['cid'], 'page': 1, 'part': ''}]
+            for page in pages:
+                title = member_view['title']
+                if len(pages) > 1:
+                    title = f"{title} - P{page['page']} {page.get('part', '')}".rstrip()
+                parts.append({'bvid': bvid, 'aid': member_view['aid'], 'cid': page['cid'],
+                              'page': page['page'], 'title': title})
+        return parts
+
+    def _playurl(self,aid,cid,query):
+        """Call the signed playurl api and return its "data" field."""
+        params = {"aid": aid, "cid": cid}
+        w_rid, wts = generate_wrid(params)
+        playurl_link = f"https://api.bilibili.com/x/player/wbi/playurl?avid={aid}&cid={cid}&{query}&fnver=0&aid={aid}&web_location=1315877&w_rid={w_rid}&wts={wts}"
+        response = http_client.get(playurl_link, headers=config.headers, verify=False)
+        response.raise_for_status()
+        return response.json().get('data') or {}
+
+    def select_video_quality(self,aid,cid,**policy):
+        """Choose the mp4 quality (qn) with the stream policy, at most config.video_quality.
+
+        The sizes of the qualities are estimated from the bandwidth of the DASH video streams,
+        so the policies other than max_bitrate cost one more playurl request.
+
+        Args:
+            aid (str) :The specific args of this video.
+            cid (str) :The specific args of this video.
+            **policy :policy, max_size, target_seconds and link_speed of stream_selector.select_stream,
+                the values in config.py by default.
+
+        Returns:
+            qn (int) :The quality to request.
+        Raises:
+            requests.exceptions.HTTPError :The playurl request failed.
+        """
+        if (policy.get('policy') or config.stream_policy) == 'max_bitrate':
+            return config.video_quality
+        streams = self.get_streams(aid, cid)
+        candidates = [stream for stream in streams["video"]
+                      if stream["id"] is not None and stream["id"] <= config.video_quality]
+        # mp4 接口返回 AVC 编码，有 AVC 流时只按 AVC 的码率估算
+        avc = [stream for stream in candidates if stream["codecs"].startswith("avc")]
+        best = stream_selector.select_stream(avc or candidates, streams["duration"], **policy)
+        return best["id"] if best is not None else config.video_quality
+
+    def get_mp4_stream(self,aid,cid,qn=None,**policy):
+        """Get the mp4 stream of the requested quality.
+
+        Args:
+            aid (str) :The specific args of this video.
+            cid (str) :The specific args of this video.
+            qn (int) :The requested quality, chosen by select_video_quality by default. The api
+                falls back to the best quality available to us.
+            **policy :Passed to select_video_quality when qn is not given.
+
+        Returns:
+            stream (dict) :{"url", "urls" (url followed by the backup mirrors), "size",
+                "quality", "accept_quality" (all qualities of this video)}.
+        Raises:
+            requests.exceptions.HTTPError :The playurl request failed.
+        """
+        qn = qn or self.select_video_quality(aid, cid, **policy)
+        data = self._playurl(aid, cid, f"qn={qn}&type=mp4&platform=html5&fnval=16")
+        durl = data['durl'][0]
+        urls = [durl['url']] + list(durl.get('backup_url') or [])
+        return {"url": urls[0], "urls": urls, "size": durl.get('size'),
+                "quality": data.get('quality'), "accept_quality": data.get('accept_quality') or []}
+
+    def get_mp4_url(self,aid,cid):
+        """Get the download link of the mp4 stream.
+
+        Args:
+            aid (str) :The specific args of this video.
+            cid (str) :The specific args of this video.
+
+        Returns:
+            video_url (str) :The download link of the mp4 stream.
+        Raises:
+            requests.exceptions.HTTPError :The playurl request failed.
+        """
+        return self.get_mp4_stream(aid, cid)["url"]
+
+    def get_streams(self,aid,cid):
+        """List every DASH video quality and audio bitrate of a video.
+
+        Args:
+            aid (str) :The specific args of this video.
+            cid (str) :The specific args of this video.
+
+        Returns:
+            streams (dict) :{"duration": seconds, "video": [...], "audio": [...]}, each stream is a dict
+                with id (quality), bandwidth (bit/s), codec (ffmpeg name, None if unknown),
+                codecs (as given by the api) and urls (base url followed by the backup mirrors).
+        Raises:
+            requests.exceptions.HTTPError :The playurl request failed.
+        """
+        # fnval=4048 请求全部 DASH 格式（含杜比全景声和无损音轨）
+        data = self._playurl(aid, cid, "qn=0&fnval=4048&fourk=1")
+        dash = data.get('dash') or {}
+        audio = list(dash.get('audio') or [])
+        for extra in ('dolby', 'flac'):
+            extra_audio = (dash.get(extra) or {}).get('audio')
+            if isinstance(extra_audio, dict):
+                audio.append(extra_audio)
+            elif extra_audio:
+                audio.extend(extra_audio)
+
+        def describe(stream):
+            codecs = str(stream.get('codecs', ''))
+            urls = [stream.get('baseUrl') or stream.get('base_url')]
+            urls += list(stream.get('backupUrl') or stream.get('backup_url') or [])
+            return {"id": stream.get('id'), "bandwidth": stream.get('bandwidth', 0),
+                    "codec": dash_codecs.get(codecs.split('.')[0]), "codecs": codecs,
+                    "urls": [url for url in urls if url]}
+
+        duration = dash.get('duration') or (data.get('timelength') or 0) / 1000
+        return {"duration": duration,
+                "video": [describe(stream) for stream in dash.get('video') or []],
+                "audio": [describe(stream) for stream in audio]}
+
+    def get_audio_stream(self,aid,cid,**policy):
+        """Get the audio-only DASH stream chosen by the stream policy.
+
+        Args:
+            aid (str) :The specific args of this video.
+            cid (str) :The specific args of this video.
+            **policy :policy, max_size, target_seconds and link_speed of stream_selector.select_stream,
+                the values in config.py by default (highest bitrate).
+
+        Returns:
+            stream (dict) :{"url": download link, "urls": url followed by the backup mirrors,
+                "codec": ffmpeg codec name or None, "bandwidth": bit/s}.
+        Raises:
+            requests.exceptions.HTTPError :The playurl request failed.
+            LookupError :The video has no DASH audio stream.
+        """
+        streams = self.get_streams(aid, cid)
+        best = stream_selector.select_stream(streams["audio"], streams["duration"], **policy)
+        if best is None or not best["urls"]:
+            raise LookupError(f"No DASH audio stream for aid={aid}, cid={cid}")
+        return {"url": best["urls"][0], "urls": best["urls"], "codec": best["codec"],
+                "bandwidth": best["bandwidth"]}
+
+    def get_audio_url(self,aid,cid):
+        """Get the download link of the best audio-only DASH stream.
+
+        Args:
+            aid (str) :The specific args of this video.
+            cid (str) :The specific args of this video.
+
+        Returns:
+            audio_url (str) :The download link of the audio stream (AAC/FLAC in an mp4 container).
+        Raises:
+            requests.exceptions.HTTPError :The playurl request failed.
+            LookupError :The video has no DASH audio stream.
+        """
+        return self.get_audio_stream(aid, cid)["url"]
+
+    def get_mp4(self,aid,cid,title,engine="thread",audio_only=False):
         """?????
         Get some specific args.
 
@@ -55,31 +378,123 @@ class download_mp4:
             aid (str) :The specific args of this video.
             cid (str) :The specific args of this video.
             title (str) :The title of this video,will be used as file name.
+            engine (str) :The download engine,"thread" or "async",
+                or "stream" to pipe the download straight into ffmpeg and keep only the converted audio.
+            audio_only (bool) :Download only the best audio stream as .m4a instead of the mp4 video.
 
         Returns:
-            None
+            path (Path) :The downloaded file, None if the download failed.
         Raises:
             None
         """
-        params = {"aid": aid, "cid": cid}
-        w_rid, wts = generate_wrid(params)
-        get_video_link = f"https://api.bilibili.com/x/player/wbi/playurl?avid={aid}&cid={cid}&qn=16&type=mp4&platform=html5&fnver=0&fnval=16&aid={aid}&web_location=1315877&w_rid={w_rid}&wts={wts}".format(aid=aid, cid=cid, w_rid=w_rid, wts=wts)
-        response = requests.get(get_video_link, headers=config.headers, verify=False).json()
-        response.raise_for_status()
-        video_url = response['data']['durl'][0]['url']
+        if audio_only:
+            stream = self.get_audio_stream(aid, cid)
+            suffix = "m4a"
+        else:
+            stream = dict(self.get_mp4_stream(aid, cid), codec=None)
+            suffix = "mp4"
         video_name = config.normalize_filename(filename = title)
     #    logging.info(f"经处理后的文件名：{video_name},开始下载视频")
+        # 测量各镜像的延迟，最快的作为主地址，其余作为下载卡住时的备用地址
+        urls = stream_selector.order_mirrors(stream["urls"])
+        video_url, mirrors = urls[0], urls[1:]
 
-        downloading.download(video_url,f"{video_name}.mp4")
+        if engine == "stream":
+            # 延迟导入，只下载时不需要加载转码模块
+            import transform
+            return transform.Transform().stream(video_url, video_name, codec=stream["codec"])
+        if engine == "async":
+            # 异步引擎把合并后的文件写到当前目录
+            success = async_downloading.download(video_url,f"{video_name}.{suffix}")
+            path = Path(f"{video_name}.{suffix}")
+        else:
+            success = downloading.download(video_url,f"{video_name}.{suffix}",
+                                           mirrors=mirrors, stall_timeout=config.stall_timeout)
+            path = downloading.output_path(f"{video_name}.{suffix}", mirrors=mirrors)
     #    logging.info(f"视频{video_name}下载完成！")
+        return path if success else None
 
-    def download_video(self,bilibili_url):
+    @staticmethod
+    def _library_format(engine, audio_only):
+        """The format stored in the library for a download mode, None when any audio format will do."""
+        if engine == "stream":
+            import transform
+            target_format = transform.load_transcode_config()['format']
+            return None if target_format == "auto" else target_format
+        return "m4a" if audio_only else "mp4"
+
+    def download_all(self,bilibili_url,audio_only=True,include_season=True,threads=4,
+                     max_concurrency=16,per_host_limit=8,max_in_flight=8):
+        """Download every page of a video (and of its collection) in one job.
+
+        All parts share the connection budget of a single async download engine, so an album
+        uploaded as a multi-P video is fetched in parallel without opening unbounded connections.
+
+        Args:
+            bilibili_url (str) :The bilibili url or the AV/BV string.
+            audio_only (bool) :Download only the audio streams.
+            include_season (bool) :Also download the other videos of the collection.
+            threads (int) :The number of concurrent segments per file.
+            max_concurrency (int) :The total number of concurrent segment requests.
+            per_host_limit (int) :The maximum number of connections per host.
+            max_in_flight (int) :The maximum number of concurrent playurl requests.
+
+        Returns:
+            results (list) :(part, path) tuples in playlist order, path is None if the part failed.
+        Raises:
+            RuntimeError :The view api of the given video returned an error code.
+        """
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        file_format = "m4a" if audio_only else "mp4"
+        parts = self.get_parts(self.get_video_id(bilibili_url), include_season=include_season)
+        paths = {}
+        pending = []
+        for part in parts:
+            record = self.library.lookup(part['bvid'], cid=part['cid'], file_format=file_format)
+            if record is not None:
+                paths[part['cid']] = record['path']
+            else:
+                pending.append(part)
+        print(f"Found {len(parts)} parts, {len(parts) - len(pending)} already in the library.")
+
+        def get_url(part):
+            if audio_only:
+                return self.get_audio_url(part['aid'], part['cid'])
+            return self.get_mp4_url(part['aid'], part['cid'])
+
+        items = []
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            futures = {executor.submit(get_url, part): part for part in pending}
+            for future in futures:
+                part = futures[future]
+                try:
+                    url = future.result()
+                except Exception as e:
+                    print(f"Failed to get the download link of '{part['title']}': {e}")
+                    continue
+                # 文件名带上 cid，标题规范化后相同的分P不会互相覆盖
+                filename = f"{config.normalize_filename(part['title'])}_{part['cid']}.{file_format}"
+                items.append((part, {"url": url, "filename": filename, "threads": threads}))
+
+        if items:
+            results = async_downloading.download_many([item for _, item in items],
+                                                      max_concurrency=max_concurrency,
+                                                      per_host_limit=per_host_limit)
+            for (part, item), success in zip(items, results):
+                if success:
+                    paths[part['cid']] = self.library.add(Path(item['filename']), part['bvid'], part['aid'],
+                                                          part['cid'], part['title'])
+        return [(part, paths.get(part['cid'])) for part in parts]
+
+    def download_video(self,bilibili_url,engine="thread",audio_only=False):
         """The main function,which achieve the downloading of the designated video
         Args:
             bilibili_url (str) :The bilibili url.
+            engine (str) :The download engine,"thread", "async" or "stream".
+            audio_only (bool) :Download only the audio stream (music mode).
 
         Returns:
-            None
+            title (str) :The title of the video.
 
         Raises:
             None
@@ -93,12 +508,27 @@ class download_mp4:
         #                     filename=log_path)
         video_id = self.get_video_id(bilibili_url)
         #logging.info(f"获取视频AV/BV号：{video_id}")
+        # 媒体库中已有时不访问网络
+        file_format = self._library_format(engine, audio_only)
+        record = self.find_in_library(video_id, file_format=file_format)
+        if record is not None:
+            print(f"'{record['title']}' is already in the library: {record['path']}")
+            return record['title']
         urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        # 多P视频（例如整张专辑）下载全部分P；边下边转不支持多个文件，只下载第一P
+        if engine != "stream" and len(self.get_parts(video_id, include_season=False)) > 1:
+            results = self.download_all(video_id, audio_only=audio_only, include_season=False)
+            print(f"Downloaded {sum(1 for _, path in results if path is not None)}/{len(results)} parts.")
+            return self.get_video_view(video_id)['title']
         aid, pic, title, cid = self.get_video_information(video_id)
         #logging.info(f"获取视频的aid：{aid},cid:{cid},标题：{title},封面地址：{pic}")
         #temp_dir = Path("./temp")
         #temp_dir.mkdir(exist_ok=True)
-        self.get_mp4(aid, cid, title)
+        path = self.get_mp4(aid, cid, title, engine=engine, audio_only=audio_only)
+        if path is not None:
+            bvid = self.get_video_view(video_id)['bvid']
+            path = self.library.add(path, bvid, aid, cid, title)
+            print(f"Saved to the library: {path}")
         return title
 
 if __name__ == '__main__':
@@ -1,28 +1,172 @@
 ﻿import requests
 import time
 import os
+import glob
+import shutil
 from pathlib import Path
 from config import headers
+import http_client
+import rate_limit
+import stream_selector
+from download_journal import DownloadJournal
+from progress import ProgressTracker
 import threading
-import queue
-import math
+from collections import deque
+from urllib.parse import urlsplit
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
+class Segment:
+    """一个待下载的字节区间，position 为下一个要写入的字节，written 为已实际写入磁盘的字节数"""
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.position = start
+        self.written = 0
+        self.lock = threading.Lock()
+
+    def remaining(self):
+        """剩余未下载的字节数"""
+        return self.end - self.position + 1
+
+    def claim(self, length):
+        """从当前位置申请写入 length 字节，返回实际可写入的字节数（区间可能已被拆分缩短）"""
+        with self.lock:
+            length = max(0, min(length, self.end - self.position + 1))
+            self.position += length
+            return length
+
+
+class SegmentScheduler:
+    """动态分段调度器
+
+    待下载区间保存在共享队列中，工作线程每次从队首切出一小段下载；
+    队列为空时，空闲线程拆分剩余字节最多的活动分段的后半部分（work stealing）。
+    分段大小根据实测的单连接吞吐量动态调整，使每段大约耗时 target_seconds 秒。
+    """
+
+    def __init__(self, total_size, threads, gaps=None, segment_size=1024 * 1024,
+                 min_segment_size=256 * 1024, max_segment_size=16 * 1024 * 1024, target_seconds=2.0):
+        self.total_size = total_size
+        self.threads = threads
+        self.segment_size = segment_size
+        self.min_segment_size = min_segment_size
+        self.max_segment_size = max_segment_size
+        self.target_seconds = target_seconds
+        self.pending = deque(gaps if gaps is not None else [(0, total_size - 1)])
+        self.active = set()
+        self.segments = []
+        self.throughput = None
+        self.failed = False
+        self.lock = threading.Lock()
+
+    def _pending_bytes(self):
+        return sum(end - start + 1 for start, end in self.pending)
+
+    def next_segment(self):
+        """获取下一个要下载的分段，全部完成或已失败时返回 None"""
+        with self.lock:
+            if self.failed:
+                return None
+            if self.pending:
+                start, end = self.pending.popleft()
+                # 临近结束时缩小分段，保证所有线程都有活干
+                size = min(self.segment_size, max(self.min_segment_size, self._pending_bytes() // self.threads))
+                if end - start + 1 > size:
+                    self.pending.appendleft((start + size, end))
+                    end = start + size - 1
+                segment = Segment(start, end)
+                self.active.add(segment)
+                self.segments.append(segment)
+                return segment
+            return self._steal()
+
+    def _steal(self):
+        """拆分剩余字节最多的活动分段，把后半部分交给空闲线程"""
+        victim = max(self.active, key=lambda seg: seg.remaining(), default=None)
+        if victim is None:
+            return None
+        with victim.lock:
+            remaining = victim.end - victim.position + 1
+            if remaining < 2 * self.min_segment_size:
+                return None
+            middle = victim.position + remaining // 2
+            segment = Segment(middle, victim.end)
+            victim.end = middle - 1
+        self.active.add(segment)
+        self.segments.append(segment)
+        return segment
+
+    def finish(self, segment, elapsed):
+        """分段下载结束，根据实测吞吐量调整后续分段大小"""
+        with self.lock:
+            self.active.discard(segment)
+            downloaded = segment.position - segment.start
+            if elapsed <= 0 or downloaded < self.min_segment_size:
+                return
+            speed = downloaded / elapsed
+            self.throughput = speed if self.throughput is None else 0.7 * self.throughput + 0.3 * speed
+            size = int(self.throughput * self.target_seconds)
+            self.segment_size = max(self.min_segment_size, min(self.max_segment_size, size))
+
+    def fail(self):
+        """标记下载失败，其余线程领取分段时将直接退出"""
+        with self.lock:
+            self.failed = True
+
+
 class DownloadManager:
-    """下载管理器，支持断点续传和多线程下载"""
+    """下载管理器，支持断点续传和多线程下载
+
+    mirrors 为同一文件的备用地址（如 playurl 返回的 backup_url）。某个地址请求失败、
+    提前断开或超过 stall_timeout 秒没有数据时，分段从当前位置起改用下一个地址继续下载。
+    """
 
-    def __init__(self, url, filename=None, chunk_size=8192, threads=4, resume=False):
+    def __init__(self, url, filename=None, chunk_size=8192, threads=4, resume=False,
+                 segment_size=1024 * 1024, preallocate=False, progress_sinks=None, stop_event=None,
+                 mirrors=None, stall_timeout=None):
         self.url = url
+        self.urls = list(dict.fromkeys([url] + [mirror for mirror in (mirrors or []) if mirror]))
+        self.url_index = 0
+        self.url_lock = threading.Lock()
+        # 缺省使用 http_client 的超时设置
+        self.request_options = {}
+        if stall_timeout:
+            connect_timeout = http_client.load_network_config()['timeout'][0]
+            self.request_options['timeout'] = (connect_timeout, stall_timeout)
         self.filename = filename or self._get_filename_from_url(url)
         self.chunk_size = chunk_size
         self.threads = threads
         self.resume = resume
+        self.segment_size = segment_size
+        self.preallocate = preallocate
+        self.progress_sinks = progress_sinks
         self.temp_dir = Path("./temp")
         self.temp_dir.mkdir(exist_ok=True)
         self.total_size = 0
         self.downloaded = 0
-        self.lock = threading.Lock()
+        self.etag = None
+        self.last_modified = None
+        self.completed_ranges = []
+        self.journal = DownloadJournal(self.temp_dir / f"{self.filename}.journal.json")
+        # 外部（例如界面）可以传入同一个 Event 来暂停下载
+        self.stop_event = stop_event or threading.Event()
+        self.cancelled = False
+
+    def stop(self):
+        """停止下载并保留已下载的部分，之后以 resume=True 重新下载即可继续"""
+        self.stop_event.set()
+
+    def cancel(self):
+        """停止下载并删除已下载的部分"""
+        self.cancelled = True
+        self.stop_event.set()
+
+    def discard(self):
+        """删除已下载的部分（分段文件、预分配文件和续传日志），用于取消已经暂停、没有在运行的下载"""
+        self.cancelled = True
+        self._discard_partial_files()
 
     def _get_filename_from_url(self, url):
         """从URL提取文件名"""
@@ -31,81 +175,273 @@ class DownloadManager:
             filename = f"download_{int(time.time())}.bin"
         return filename
 
+    def _current_url(self):
+        with self.url_lock:
+            return self.urls[self.url_index]
+
+    def _failover(self, failed_url):
+        """failed_url 出错后切换到下一个地址，没有备用地址时返回 False"""
+        with self.url_lock:
+            if len(self.urls) < 2:
+                return False
+            # 其他线程可能已经切换过
+            if self.urls[self.url_index] == failed_url:
+                self.url_index = (self.url_index + 1) % len(self.urls)
+                print(f"\n切换到备用地址: {urlsplit(self.urls[self.url_index]).hostname}")
+            return True
+
     def _get_file_size(self):
-        """获取文件大小"""
+        """获取文件大小，当前地址不可用时依次尝试备用地址"""
+        for _ in self.urls:
+            url = self._current_url()
+            try:
+                head_response = http_client.head(url, allow_redirects=True, headers=headers,
+                                                  **self.request_options)
+                head_response.raise_for_status()
+                self._record_validators(head_response.headers)
+
+                if 'content-length' in head_response.headers:
+                    return int(head_response.headers['content-length'])
+
+                response = http_client.get(url, stream=True, allow_redirects=True, headers=headers,
+                                           **self.request_options)
+                response.raise_for_status()
+                self._record_validators(response.headers)
+
+                if 'content-length' in response.headers:
+                    return int(response.headers['content-length'])
+                return None
+            except requests.exceptions.RequestException:
+                if not self._failover(url):
+                    return None
+        return None
+
+    def _record_validators(self, response_headers):
+        """记录用于校验续传文件是否变化的 ETag / Last-Modified"""
+        self.etag = response_headers.get('etag', self.etag)
+        self.last_modified = response_headers.get('last-modified', self.last_modified)
+
+    def _part_filename(self, start_byte):
+        """分段文件以起始偏移命名，合并时按偏移排序"""
+        return self.temp_dir / f"{self.filename}.part_{start_byte}"
+
+    def _part_files(self):
+        """temp 目录中属于本文件的所有分段文件，文件名中的 [] 等字符按字面匹配"""
+        return list(self.temp_dir.glob(f"{glob.escape(self.filename)}.part_*"))
+
+    def _expected_parts(self, segments):
+        """按偏移排序的分段文件：续传前已完成的区间加上本次下载的各分段"""
+        starts = {start for start, _ in self.completed_ranges}
+        starts.update(segment.start for segment in segments)
+        return [self._part_filename(start) for start in sorted(starts)]
+
+    def _finish_parts(self, segments, final_path):
+        """检查分段文件齐全且总大小正确后再合并，合并后再次核对文件大小"""
+        part_files = self._expected_parts(segments)
         try:
-            head_response = requests.head(self.url, allow_redirects=True, headers=headers)
-            head_response.raise_for_status()
+            parts_size = sum(part_file.stat().st_size for part_file in part_files)
+        except OSError as e:
+            print(f"分段文件缺失: {e}")
+            return False
+        if parts_size != self.total_size:
+            print(f"分段文件共 {parts_size:,} 字节，与文件大小 {self.total_size:,} 字节不一致")
+            return False
+        if not self._merge_parts(part_files, final_path):
+            return False
+        return self._check_size(final_path)
+
+    def _check_size(self, final_path):
+        """最终文件的大小必须与服务器返回的文件大小一致"""
+        size = final_path.stat().st_size
+        if size != self.total_size:
+            print(f"✗ 文件大小 {size:,} 字节与预期的 {self.total_size:,} 字节不一致")
+            final_path.unlink(missing_ok=True)
+            return False
+        return True
 
-            if 'content-length' in head_response.headers:
-                return int(head_response.headers['content-length'])
+    def _download_path(self):
+        """预分配模式下，下载过程中使用的目标文件"""
+        return self.temp_dir / f"{self.filename}.download"
 
-            response = requests.get(self.url, stream=True, allow_redirects=True, headers=headers)
-            response.raise_for_status()
+    def _preallocate(self):
+        """创建与最终文件等大的文件，各线程直接写入对应偏移"""
+        with open(self._download_path(), 'wb') as f:
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(f.fileno(), 0, self.total_size)
+            else:
+                f.truncate(self.total_size)
 
-            if 'content-length' in response.headers:
-                return int(response.headers['content-length'])
-        except requests.exceptions.RequestException:
-            pass
-        return None
+    def _open_segment_file(self, segment):
+        """打开分段的写入目标：预分配模式下定位到目标文件的对应偏移，否则写入独立的分段文件
+
+        使用无缓冲写入，保证日志中记录的已写入字节数确实已交给操作系统。
+        """
+        if self.preallocate:
+            f = open(self._download_path(), 'r+b', buffering=0)
+            f.seek(segment.position)
+            return f
+        return open(self._part_filename(segment.start), 'wb', buffering=0)
+
+    def _write_mode(self):
+        return 'preallocate' if self.preallocate else 'parts'
+
+    def _discard_partial_files(self):
+        """删除残留的分段文件、预分配文件和日志"""
+        for part_file in self._part_files():
+            part_file.unlink(missing_ok=True)
+        self._download_path().unlink(missing_ok=True)
+        self.journal.remove()
 
     def _get_resume_info(self):
-        """获取断点续传信息"""
-        if not self.resume:
+        """根据续传日志获取断点续传信息
+
+        只有日志中的URL、文件大小、ETag/Last-Modified 和写入模式都与本次下载一致时才续传，
+        分段文件按日志中记录的已写入字节数截断，日志之外的分段文件一律删除。
+
+        Returns:
+            tuple: (已下载字节数, 已下载区间列表[(start, end)])
+        """
+        data = self.journal.load() if self.resume else None
+        if data is None or not self.journal.matches(data, self.url, self.total_size, self.etag,
+                                                    self.last_modified, self._write_mode()):
+            if data is not None:
+                print("续传日志与当前文件不一致，重新下载")
+            self._discard_partial_files()
+            return 0, []
+
+        if self.preallocate and not self._download_path().exists():
+            self.journal.remove()
             return 0, []
 
-        # 检查是否有已下载的部分
-        part_files = list(self.temp_dir.glob(f"{self.filename}.part_*"))
         downloaded = 0
         parts = []
+        known_parts = set()
+        for start, end, written in data['segments']:
+            if not self.preallocate:
+                part_file = self._part_filename(start)
+                known_parts.add(part_file.name)
+                try:
+                    written = min(written, part_file.stat().st_size)
+                except OSError:
+                    written = 0
+                if written > 0:
+                    # 截掉日志之后写入的数据，这部分会重新下载
+                    with open(part_file, 'r+b') as f:
+                        f.truncate(written)
+                else:
+                    part_file.unlink(missing_ok=True)
+            written = min(written, end - start + 1)
+            if written > 0:
+                downloaded += written
+                parts.append((start, start + written - 1))
+
+        if not self.preallocate:
+            for part_file in self._part_files():
+                if part_file.name not in known_parts:
+                    part_file.unlink(missing_ok=True)
 
-        for part_file in part_files:
-            try:
-                size = part_file.stat().st_size
-                downloaded += size
-                # 从文件名中提取部分范围信息
-                parts.append(str(part_file))
-            except:
-                pass
-
-        return downloaded, parts
-
-    def _download_part(self, start_byte, end_byte, part_num, progress_callback=None):
-        """下载文件的一部分"""
-        part_filename = self.temp_dir / f"{self.filename}.part_{part_num}"
-
-        # 如果启用断点续传且文件已存在，获取已下载的大小
-        resume_from = 0
-        if self.resume and part_filename.exists():
-            resume_from = part_filename.stat().st_size
-            start_byte += resume_from
+        return downloaded, sorted(parts)
 
-        if start_byte > end_byte:
-            # 这部分已经下载完成
-            return part_filename, True
+    def _save_journal(self, segments):
+        """把已完成区间和当前所有分段的写入进度写入日志"""
+        entries = [(start, end, end - start + 1) for start, end in self.completed_ranges]
+        entries += [(segment.start, segment.end, segment.written) for segment in segments]
+        self.journal.save(self.url, self.total_size, self.etag, self.last_modified,
+                          self._write_mode(), entries)
 
-        headers_copy = headers.copy()
-        headers_copy['Range'] = f'bytes={start_byte}-{end_byte}'
+    def _journal_loop(self, segments_source, finished, interval=1.0):
+        """后台线程：下载期间定期写入续传日志"""
+        while not finished.wait(interval):
+            try:
+                self._save_journal(list(segments_source()))
+            except OSError:
+                pass
 
+    def _missing_ranges(self, completed):
+        """根据已下载区间计算仍需下载的区间"""
+        gaps = []
+        position = 0
+        for start, end in completed:
+            if start > position:
+                gaps.append((position, start - 1))
+            position = max(position, end + 1)
+        if position < self.total_size:
+            gaps.append((position, self.total_size - 1))
+        return gaps
+
+    def _download_segment(self, segment, counter):
+        """下载一个分段，分段可能在下载过程中被其他线程拆分缩短
+
+        失败时按 rate_limit.RetryPolicy 退避后从已写入的位置继续，每次重试轮换到下一个备用地址。
+        """
         try:
-            response = requests.get(self.url, stream=True, headers=headers_copy)
-            response.raise_for_status()
+            f = self._open_segment_file(segment)
+        except OSError as e:
+            print(f"\n下载分段 {segment.start}-{segment.end} 失败: {e}")
+            return False
 
-            mode = 'ab' if resume_from > 0 else 'wb'
-            with open(part_filename, mode) as f:
-                for chunk in response.iter_content(chunk_size=self.chunk_size):
-                    if chunk:
-                        f.write(chunk)
-                        with self.lock:
-                            self.downloaded += len(chunk)
-                            if progress_callback:
-                                progress_callback()
+        policy = rate_limit.get_policy()
+        attempts = max(len(self.urls), policy.attempts)
+        with f:
+            for attempt in range(attempts):
+                url = self._current_url()
+                headers_copy = headers.copy()
+                headers_copy['Range'] = f'bytes={segment.position}-{segment.end}'
+                retry_after = None
+                try:
+                    response = http_client.get(url, stream=True, headers=headers_copy, retry=False,
+                                               **self.request_options)
+                    response.raise_for_status()
+
+                    with response:
+                        for chunk in response.iter_content(chunk_size=self.chunk_size):
+                            if self.stop_event.is_set():
+                                return False
+                            if not chunk:
+                                continue
+                            length = segment.claim(len(chunk))
+                            if length:
+                                f.write(chunk[:length])
+                                segment.written += length
+                                counter.add(length)
+                            if segment.remaining() <= 0:
+                                break
 
-            return part_filename, True
+                    if segment.remaining() <= 0:
+                        return True
+                    error = "连接提前关闭"
+                except requests.exceptions.HTTPError as e:
+                    error = e
+                    retry_after = policy.retry_after(e.response.headers)
+                    # 404/403 等错误重试无用，只尝试其余的备用地址
+                    if e.response.status_code not in policy.retry_statuses and attempt + 1 >= len(self.urls):
+                        print(f"\n下载分段 {segment.start}-{segment.end} 失败: {error}")
+                        return False
+                except Exception as e:
+                    error = e
+                if self.stop_event.is_set():
+                    return False
+                print(f"\n下载分段 {segment.start}-{segment.end} 失败: {error}")
+                if attempt + 1 >= attempts:
+                    return False
+                self._failover(url)
+                if self.stop_event.wait(policy.backoff(attempt, retry_after)):
+                    return False
+            return False
 
-        except Exception as e:
-            print(f"\n下载部分 {part_num} 失败: {e}")
-            return part_filename, False
+    def _worker(self, scheduler, progress):
+        """工作线程：不断领取分段下载，直到没有剩余分段"""
+        counter = progress.counter()
+        while True:
+            segment = scheduler.next_segment()
+            if segment is None:
+                return not scheduler.failed
+            started = time.time()
+            success = self._download_segment(segment, counter)
+            scheduler.finish(segment, time.time() - started)
+            if not success:
+                scheduler.fail()
+                return False
 
     def _merge_parts(self, part_files, final_path):
         """合并所有部分文件"""
@@ -138,82 +474,90 @@ class DownloadManager:
         print("-" * 60)
 
         # 检查断点续传
-        resume_downloaded, existing_parts = self._get_resume_info()
+        resume_downloaded, completed_ranges = self._get_resume_info()
+        if self.preallocate and not completed_ranges:
+            self._preallocate()
+        self.completed_ranges = completed_ranges
         self.downloaded = resume_downloaded
 
         if resume_downloaded > 0:
             print(f"发现已下载部分: {resume_downloaded:,} 字节 ({resume_downloaded / self.total_size:.1%})")
 
-        # 计算每个线程的下载范围
-        part_size = math.ceil(self.total_size / self.threads)
-        ranges = []
-        for i in range(self.threads):
-            start = i * part_size
-            end = min((i + 1) * part_size - 1, self.total_size - 1)
-            ranges.append((start, end, i))
-
-        # 显示进度条的辅助函数
-        start_time = time.time()
-        bar_width = 40
-
-        def update_progress():
-            nonlocal start_time, bar_width
-            elapsed_time = time.time() - start_time
-
-            with self.lock:
-                progress = self.downloaded / self.total_size
-                filled_length = int(bar_width * progress)
-                bar = '█' * filled_length + '-' * (bar_width - filled_length)
-
-                speed = self.downloaded / elapsed_time if elapsed_time > 0 else 0
-                if speed > 0 and progress < 1:
-                    remaining_time = (self.total_size - self.downloaded) / speed
-                    time_str = f"剩余: {remaining_time:.1f}s"
-                else:
-                    time_str = "剩余: 计算中..."
-
-                print(f'\r[{bar}] {progress:.1%} | '
-                      f'{self.downloaded:,}/{self.total_size:,} | '
-                      f'{speed / 1024 / 1024:.2f} MB/s | {time_str}',
-                      end='', flush=True)
+        # 剩余区间放入共享队列，由各线程按动态大小领取
+        scheduler = SegmentScheduler(self.total_size, self.threads,
+                                     gaps=self._missing_ranges(completed_ranges),
+                                     segment_size=self.segment_size)
 
         # 多线程下载
         print(f"使用 {self.threads} 个线程下载...")
 
-        part_files = []
+        # 各线程只累加自己的计数器，进度由后台线程定时输出
+        progress = ProgressTracker(self.total_size, self.progress_sinks, initial=resume_downloaded)
+        progress.start()
+        start_time = progress.start_time
+
         success = True
-        completed = 0
 
-        with ThreadPoolExecutor(max_workers=self.threads) as executor:
-            # 提交所有下载任务
-            future_to_part = {
-                executor.submit(self._download_part, start, end, part_num, update_progress): part_num
-                for start, end, part_num in ranges
+        # 后台定期写入续传日志
+        journal_finished = threading.Event()
+        journal_thread = threading.Thread(target=self._journal_loop,
+                                          args=(lambda: scheduler.segments, journal_finished),
+                                          daemon=True)
+        journal_thread.start()
+
+        executor = ThreadPoolExecutor(max_workers=self.threads)
+        try:
+            # 每个线程循环领取分段，直到队列为空且无可拆分的分段
+            future_to_worker = {
+                executor.submit(self._worker, scheduler, progress): worker_num
+                for worker_num in range(self.threads)
             }
 
             # 处理完成的任务
-            for future in as_completed(future_to_part):
-                part_num = future_to_part[future]
+            for future in as_completed(future_to_worker):
+                worker_num = future_to_worker[future]
                 try:
-                    part_file, part_success = future.result()
-                    part_files.append(part_file)
-                    completed += 1
-                    if not part_success:
+                    if not future.result():
                         success = False
                 except Exception as e:
-                    print(f"\n线程 {part_num} 异常: {e}")
+                    print(f"\n线程 {worker_num} 异常: {e}")
+                    scheduler.fail()
                     success = False
-
-        # 显示最终进度
-        update_progress()
-        print()
-
-        if success and completed == self.threads:
-            # 合并文件
+        except KeyboardInterrupt:
+            print("\n✗ Download was interrupted by the user, progress has been saved")
+            self.stop_event.set()
+            scheduler.fail()
+            success = False
+        finally:
+            executor.shutdown(wait=True)
+            journal_finished.set()
+            journal_thread.join()
+            self._save_journal(scheduler.segments)
+            # 显示最终进度
+            progress.stop()
+            self.downloaded = progress.value()
+
+        if self.cancelled:
+            self._discard_partial_files()
+            print("✗ 下载已取消")
+            return False
+        if self.stop_event.is_set() and not success:
+            print("下载已暂停，进度已保存")
+            return False
+        if success and self.downloaded >= self.total_size:
             final_path = Path(self.filename)
-            print("正在合并文件...")
-            if self._merge_parts(part_files, final_path):
+            if self.preallocate:
+                # 数据已在正确的偏移处，直接移动到最终位置
+                shutil.move(self._download_path(), final_path)
+                finished = self._check_size(final_path)
+            else:
+                # 合并文件
+                print("正在合并文件...")
+                finished = self._finish_parts(scheduler.segments, final_path)
+            if finished:
+                self.journal.remove()
                 total_time = time.time() - start_time
+                stream_selector.record_throughput(self.downloaded - resume_downloaded, total_time)
                 print(f"✓ 下载完成! 总耗时: {total_time:.2f}s, "
                       f"平均速度: {self.downloaded / total_time / 1024 / 1024:.2f} MB/s")
                 return True
@@ -224,13 +568,23 @@ class DownloadManager:
             return False
 
     def _single_thread_download(self):
-        """单线程下载（作为备选）"""
-        # 这里可以调用原始的download函数，或者简单实现
+        """单线程下载（作为备选）
+
+        原始下载方式保存在 temp 目录，完成后移动到当前目录，与多线程下载的保存位置（见 output_path）一致；
+        依次尝试主地址和各备用地址。
+        """
         print("切换到单线程下载模式...")
-        return download(self.url, self.filename, self.chunk_size)
+        for url in self.urls:
+            if self.stop_event.is_set():
+                return False
+            if _original_download(url, self.filename, self.chunk_size, self.progress_sinks):
+                shutil.move(self.temp_dir / self.filename, Path(self.filename))
+                return True
+        return False
 
 
-def download(url, filename=None, chunk_size=8192, threads=1, resume=False):
+def download(url, filename=None, chunk_size=8192, threads=1, resume=False, preallocate=False,
+             progress_sinks=None, mirrors=None, stall_timeout=None):
     """
     增强版下载函数，支持断点续传和多线程下载
 
@@ -240,20 +594,36 @@ def download(url, filename=None, chunk_size=8192, threads=1, resume=False):
         chunk_size: 下载块大小（字节）
         threads: 下载线程数（默认为1，单线程）
         resume: 是否启用断点续传（默认False）
+        preallocate: 是否预分配目标文件并由各线程直接写入对应偏移，省去分段合并（默认False）
+        progress_sinks: 进度输出端列表（见 progress 模块），默认为命令行进度条
+        mirrors: 备用地址列表，主地址出错或卡住时切换（提供时总是使用下载管理器）
+        stall_timeout: 超过该时间（秒）没有收到数据即视为卡住
 
     Returns:
         bool: 下载是否成功
     """
     # 如果threads=1且resume=False，使用原始下载方式
-    if threads == 1 and not resume:
-        return _original_download(url, filename, chunk_size)
+    if _use_original_download(threads, resume, mirrors):
+        return _original_download(url, filename, chunk_size, progress_sinks)
 
     # 否则使用增强版下载管理器
-    manager = DownloadManager(url, filename, chunk_size, threads, resume)
+    manager = DownloadManager(url, filename, chunk_size, threads, resume, preallocate=preallocate,
+                              progress_sinks=progress_sinks, mirrors=mirrors, stall_timeout=stall_timeout)
     return manager.download()
 
 
-def _original_download(url, filename=None, chunk_size=8192):
+def _use_original_download(threads, resume, mirrors):
+    return threads == 1 and not resume and not mirrors
+
+
+def output_path(filename, threads=1, resume=False, mirrors=None):
+    """download() 使用相同参数时文件的保存位置：原始下载方式保存在 temp 目录，下载管理器保存在当前目录"""
+    if _use_original_download(threads, resume, mirrors):
+        return Path("./temp") / filename
+    return Path(filename)
+
+
+def _original_download(url, filename=None, chunk_size=8192, progress_sinks=None):
     """
     原始下载函数（保持与原代码一致）
     """
@@ -262,7 +632,7 @@ def _original_download(url, filename=None, chunk_size=8192):
 
     try:
         # 发送HEAD请求获取文件信息
-        head_response = requests.head(url, allow_redirects=True, headers=headers)
+        head_response = http_client.head(url, allow_redirects=True, headers=headers)
         head_response.raise_for_status()
 
         # 获取文件大小
@@ -270,7 +640,7 @@ def _original_download(url, filename=None, chunk_size=8192):
             total_size = int(head_response.headers['content-length'])
         else:
             # 如果HEAD请求没有content-length，尝试GET请求
-            response = requests.get(url, stream=True, allow_redirects=True, headers=headers)
+            response = http_client.get(url, stream=True, allow_redirects=True, headers=headers)
             response.raise_for_status()
 
             if 'content-length' in response.headers:
@@ -295,7 +665,7 @@ def _original_download(url, filename=None, chunk_size=8192):
 
     try:
         # 发送GET请求
-        response = requests.get(url, stream=True, allow_redirects=True, headers=headers)
+        response = http_client.get(url, stream=True, allow_redirects=True, headers=headers)
         response.raise_for_status()
 
         # 如果之前没有获取到文件大小，现在再尝试一次
@@ -303,51 +673,26 @@ def _original_download(url, filename=None, chunk_size=8192):
             total_size = int(response.headers['content-length'])
             print(f"检测到文件大小: {total_size:,} 字节")
 
-        # 进度条参数
-        bar_width = 40
-        downloaded = 0
-        start_time = time.time()
         downloading_path = Path("./temp")
         downloading_name = downloading_path / filename
+        # 进度由后台线程定时输出，写入循环只累加计数
+        progress = ProgressTracker(total_size, progress_sinks)
+        counter = progress.counter()
+        progress.start()
+        start_time = progress.start_time
         # 打开文件进行写入
-        with open(downloading_name, 'wb') as file:
-            for chunk in response.iter_content(chunk_size=chunk_size):
-                if chunk:
-                    file.write(chunk)
-                    downloaded += len(chunk)
-
-                    # 如果有文件大小信息，显示完整进度条
-                    if total_size:
-                        progress = downloaded / total_size
-                        filled_length = int(bar_width * progress)
-                        bar = '█' * filled_length + '-' * (bar_width - filled_length)
-
-                        # 计算下载速度和剩余时间
-                        elapsed_time = time.time() - start_time
-                        speed = downloaded / elapsed_time if elapsed_time > 0 else 0
-
-                        if speed > 0:
-                            remaining_time = (total_size - downloaded) / speed
-                            time_str = f"剩余: {remaining_time:.1f}s"
-                        else:
-                            time_str = "剩余: 计算中..."
-
-                        # 格式化显示
-                        print(f'\r[{bar}] {progress:.1%} | '
-                              f'{downloaded:,}/{total_size:,} | '
-                              f'{speed / 1024 / 1024:.2f} MB/s | {time_str}',
-                              end='', flush=True)
-                    else:
-                        # 没有文件大小信息，只显示已下载量
-                        elapsed_time = time.time() - start_time
-                        speed = downloaded / elapsed_time if elapsed_time > 0 else 0
-                        print(f'\r已下载: {downloaded:,} 字节 | '
-                              f'速度: {speed / 1024 / 1024:.2f} MB/s',
-                              end='', flush=True)
+        try:
+            with open(downloading_name, 'wb') as file:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        file.write(chunk)
+                        counter.add(len(chunk))
+        finally:
+            progress.stop()
 
         # 下载完成
+        downloaded = progress.value()
         total_time = time.time() - start_time
-        print()  # 换行
 
         if total_size:
             if downloaded == total_size:
@@ -1,7 +1,19 @@
 import hashlib
+import threading
 import time
 import urllib.parse
-from typing import Dict, Any, Tuple
+from pathlib import PurePosixPath
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+# 生成32字符密钥时从 img_key + sub_key 中取字符的顺序
+indices = [46, 47, 18, 2, 53, 8, 23, 32, 15, 50, 10, 31, 58, 3, 45, 35, 27, 43, 5, 49, 33, 9, 42, 19, 29, 28, 14,
+           39, 12, 38, 41, 13, 37, 48, 7, 16, 24, 55, 40, 61, 26, 17, 0, 1, 60, 51, 30, 4, 22, 25, 54, 21, 56, 59,
+           6, 63, 57, 62, 11, 36, 20, 34, 44, 52]
+
+# 参数值中需要去掉的字符
+filter_table = str.maketrans('', '', "!'()*")
+
+nav_url = "https://api.bilibili.com/x/web-interface/nav"
 
 
 def sr(encrypted_str: str) -> str:
@@ -9,62 +21,125 @@ def sr(encrypted_str: str) -> str:
     return ''.join(chr(ord(c) - 1) for c in encrypted_str)
 
 
-def generate_wrid(params: Dict[str, Any]) -> Tuple[str, str]:
-    """
-    生成w_rid参数
-
-    Args:
-        params: 请求参数字典，应包含aid、cid等参数
-
-    Returns:
-        包含w_rid和wts的元组 (w_rid, wts)
-    """
-    # 使用固定的默认密钥
-    img_key = sr("d569546b86c252:db:9bc7e99c5d71e5")
-    sub_key = sr("557251g796:g54:f:ee94g8fg969e2de")
-
-    # 生成32字符的密钥u
-    indices = [46, 47, 18, 2, 53, 8, 23, 32, 15, 50, 10, 31, 58, 3, 45, 35, 27, 43, 5, 49, 33, 9, 42, 19, 29, 28, 14,
-               39, 12, 38, 41, 13, 37, 48, 7, 16, 24, 55, 40, 61, 26, 17, 0, 1, 60, 51, 30, 4, 22, 25, 54, 21, 56, 59,
-               6, 63, 57, 62, 11, 36, 20, 34, 44, 52]
+def get_mixin_key(img_key: str, sub_key: str) -> str:
+    """按 indices 的顺序从 img_key + sub_key 中取字符，生成32字符的密钥"""
     r = img_key + sub_key
-    u_chars = []
+    return ''.join(r[idx] for idx in indices if idx < len(r))[:32]
 
-    for idx in indices:
-        if idx < len(r):
-            u_chars.append(r[idx])
 
-    u = ''.join(u_chars)[:32]
+class WbiSigner:
+    """WBI 签名器
 
-    # 获取当前时间戳（秒级）
-    wts = str(int(time.time()))
+    32字符的密钥只在 img_key/sub_key 变化时计算一次。密钥每天轮换，超过 key_ttl 秒后，
+    下一次签名前会从 nav 接口获取新的 img_key/sub_key；获取失败时继续使用原来的密钥。
 
-    # 构建参数字符串
-    s = params.copy()
-    s['wts'] = wts
-
-    # 对参数进行排序和处理
-    sorted_keys = sorted(s.keys())
-    f = []
-
-    for key in sorted_keys:
-        value = s[key]
-        if value is None:
-            continue
+    Args:
+        img_key (str): 初始的 img_key，缺省使用内置的默认密钥
+        sub_key (str): 初始的 sub_key，缺省使用内置的默认密钥
+        key_ttl (float): 密钥的有效期（秒），None 表示不自动刷新
+    """
 
-        # 如果是字符串，移除特殊字符
-        if isinstance(value, str):
-            value = value.replace("!", "").replace("'", "").replace("(", "").replace(")", "").replace("*", "")
+    def __init__(self, img_key: Optional[str] = None, sub_key: Optional[str] = None,
+                 key_ttl: Optional[float] = 6 * 3600):
+        self.key_ttl = key_ttl
+        self.lock = threading.Lock()
+        self.fetched_at = 0.0
+        self._set_keys(img_key or sr("d569546b86c252:db:9bc7e99c5d71e5"),
+                       sub_key or sr("557251g796:g54:f:ee94g8fg969e2de"))
+
+    def _set_keys(self, img_key: str, sub_key: str) -> None:
+        self.img_key = img_key
+        self.sub_key = sub_key
+        self.mixin_key = get_mixin_key(img_key, sub_key)
+
+    def _expired(self) -> bool:
+        return self.key_ttl is not None and time.time() - self.fetched_at > self.key_ttl
+
+    def refresh(self, force: bool = True) -> bool:
+        """从 nav 接口获取当前的 img_key/sub_key
+
+        Args:
+            force: 为 False 时，如果等待锁期间其他线程已经刷新过密钥，则不再重复请求
+
+        Returns:
+            bool: 是否获取成功（没有重复请求时返回 True）
+        """
+        # 延迟导入，只做签名时不需要加载网络模块
+        import http_client
+        with self.lock:
+            if not force and not self._expired():
+                return True
+            self.fetched_at = time.time()
+            try:
+                response = http_client.get(nav_url)
+                wbi_img = response.json()['data']['wbi_img']
+                img_key = PurePosixPath(urllib.parse.urlsplit(wbi_img['img_url']).path).stem
+                sub_key = PurePosixPath(urllib.parse.urlsplit(wbi_img['sub_url']).path).stem
+            except Exception:
+                return False
+            if img_key and sub_key:
+                self._set_keys(img_key, sub_key)
+                return True
+            return False
+
+    def _current_key(self) -> str:
+        if self._expired():
+            # 多个线程同时发现密钥过期时，只有第一个取得锁的线程请求 nav 接口
+            self.refresh(force=False)
+        return self.mixin_key
+
+    @staticmethod
+    def _query(params: Dict[str, Any]) -> str:
+        """按键排序、去掉特殊字符并 URL 编码后的参数字符串"""
+        f = []
+        for key in sorted(params):
+            value = params[key]
+            if value is None:
+                continue
+            if isinstance(value, str):
+                value = value.translate(filter_table)
+            f.append(f"{urllib.parse.quote(key, safe='')}={urllib.parse.quote(str(value), safe='')}")
+        return '&'.join(f)
+
+    def sign(self, params: Dict[str, Any], wts: Optional[str] = None) -> Tuple[str, str]:
+        """
+        生成w_rid参数
+
+        Args:
+            params: 请求参数字典，应包含aid、cid等参数
+            wts: 时间戳（秒级），缺省使用当前时间
+
+        Returns:
+            包含w_rid和wts的元组 (w_rid, wts)
+        """
+        mixin_key = self._current_key()
+        wts = wts or str(int(time.time()))
+        v = self._query({**params, 'wts': wts})
+        return hashlib.md5((v + mixin_key).encode('utf-8')).hexdigest(), wts
+
+    def sign_many(self, params_list: Iterable[Dict[str, Any]]) -> List[Tuple[str, str]]:
+        """批量签名，所有请求共用同一个时间戳和密钥
+
+        Returns:
+            与 params_list 顺序一致的 (w_rid, wts) 列表
+        """
+        mixin_key = self._current_key()
+        wts = str(int(time.time()))
+        return [(hashlib.md5((self._query({**params, 'wts': wts}) + mixin_key).encode('utf-8')).hexdigest(), wts)
+                for params in params_list]
+
+
+default_signer = WbiSigner()
 
-        # URL编码键和值
-        encoded_key = urllib.parse.quote(key, safe='')
-        encoded_value = urllib.parse.quote(str(value), safe='')
-        f.append(f"{encoded_key}={encoded_value}")
 
-    v = '&'.join(f)
+def generate_wrid(params: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    生成w_rid参数
 
-    # 计算MD5哈希
-    md5_input = v + u
-    w_rid = hashlib.md5(md5_input.encode('utf-8')).hexdigest()
+    Args:
+        params: 请求参数字典，应包含aid、cid等参数
 
-    return w_rid, wts
\ No newline at end of file
+    Returns:
+        包含w_rid和wts的元组 (w_rid, wts)
+    """
+    return default_signer.sign(params)
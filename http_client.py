@@ -0,0 +1,142 @@
+import configparser
+import logging
+import threading
+import time
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+import rate_limit
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def load_network_config(config_path=Path("config.ini")):
+    """读取网络参数，config.ini 中 [network] 段的值优先于 config.py 中的默认值
+
+    Args:
+        config_path (Path): 配置文件路径
+
+    Returns:
+        dict: 包含 timeout、pool_connections、pool_maxsize 的字典
+    """
+    settings = {
+        'timeout': config.request_timeout,
+        'pool_connections': config.pool_connections,
+        'pool_maxsize': config.pool_maxsize,
+    }
+    parser = configparser.ConfigParser()
+    if not config_path.exists():
+        return settings
+    try:
+        parser.read(config_path, encoding='utf-8')
+    except configparser.Error:
+        return settings
+    if not parser.has_section('network'):
+        return settings
+
+    section = parser['network']
+    connect_timeout = section.getfloat('connect_timeout', fallback=config.request_timeout[0])
+    read_timeout = section.getfloat('read_timeout', fallback=config.request_timeout[1])
+    settings['timeout'] = (connect_timeout, read_timeout)
+    settings['pool_connections'] = section.getint('pool_connections', fallback=config.pool_connections)
+    settings['pool_maxsize'] = section.getint('pool_maxsize', fallback=config.pool_maxsize)
+    return settings
+
+
+def _build_session():
+    """创建带连接池的 Session，为每个常用主机挂载独立的连接池"""
+    settings = load_network_config()
+    session = requests.Session()
+    session.headers.update(config.headers)
+
+    def make_adapter():
+        return HTTPAdapter(pool_connections=settings['pool_connections'],
+                           pool_maxsize=settings['pool_maxsize'],
+                           pool_block=False)
+
+    # 其他主机（如动态分配的CDN节点）共用默认连接池
+    session.mount('http://', make_adapter())
+    session.mount('https://', make_adapter())
+    for host in config.pooled_hosts:
+        session.mount(f'https://{host}', make_adapter())
+    session.default_timeout = settings['timeout']
+    return session
+
+
+def get_session():
+    """获取全局共享的 Session（线程安全，首次调用时创建）"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def close_session():
+    """关闭全局 Session 并释放所有连接"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def request(method, url, retry=True, **kwargs):
+    """通过共享 Session 发送请求，未指定时使用默认请求头和超时
+
+    每次发送前先从该类接口的令牌桶取得令牌；连接失败、超时以及风控或服务器错误的响应
+    按 rate_limit.RetryPolicy 退避后重试，重试用尽后返回最后一次的响应或抛出最后一次的异常。
+
+    Args:
+        method (str): HTTP 方法
+        url (str): 请求地址
+        retry (bool): 是否自动重试，调用方自行处理重试时传入 False
+        **kwargs: 透传给 requests.Session.request 的参数
+
+    Returns:
+        requests.Response: 响应对象
+    """
+    session = get_session()
+    kwargs.setdefault('timeout', session.default_timeout)
+    if kwargs.get('headers') is None:
+        kwargs['headers'] = config.headers
+    limiter = rate_limit.get_limiter(url)
+    policy = rate_limit.get_policy()
+    attempts = policy.attempts if retry else 1
+    for attempt in range(attempts):
+        if limiter is not None:
+            limiter.acquire()
+        last_attempt = attempt + 1 >= attempts
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if last_attempt:
+                raise
+            delay = policy.backoff(attempt)
+            reason = e
+        else:
+            if last_attempt or not policy.should_retry(response, kwargs.get('stream', False)):
+                return response
+            delay = policy.backoff(attempt, policy.retry_after(response.headers))
+            reason = f"HTTP {response.status_code}"
+            response.close()
+        logger.info("Retrying %s %s in %.1fs (attempt %d/%d): %s",
+                    method, url, delay, attempt + 2, attempts, reason)
+        time.sleep(delay)
+
+
+def get(url, **kwargs):
+    """发送 GET 请求"""
+    return request('GET', url, **kwargs)
+
+
+def head(url, **kwargs):
+    """发送 HEAD 请求"""
+    return request('HEAD', url, **kwargs)
@@ -0,0 +1,296 @@
+import argparse
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import config
+
+# 任务依次经过的阶段，failed 表示最近一次处理出错
+states = ['queued', 'searched', 'resolved', 'downloaded', 'transcoded']
+
+
+class JobQueue:
+    """sqlite 持久化的批量下载任务队列
+
+    每首歌是一条任务，记录已完成的阶段（stage）、当前状态（state，出错时为 failed）
+    以及各阶段的中间结果（视频 id、cid、下载地址、文件路径等）。程序崩溃或中断后，
+    任务从最后完成的阶段继续，不会从头重新处理整个列表。
+
+    领取任务在一个 IMMEDIATE 事务中完成，同一台机器上的多个进程可以共用一个队列文件。
+    领取的任务带有租约，处理期间由 heartbeat 定期续期；领取者进程已退出或租约过期的任务可以被重新领取。
+    租约过期后被其他进程重新领取的任务，原领取者不能再更新它的进度。
+
+    Args:
+        path (Path): sqlite 数据库文件路径
+        lease (float): 租约时长（秒）
+    """
+
+    def __init__(self, path=None, lease=None):
+        self.path = Path(path or config.job_queue_path)
+        self.lease = lease or config.job_lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        # 自动提交模式，事务由 _transaction 显式开启；多个线程共用一个连接，访问由 self.lock 串行化
+        self.connection = sqlite3.connect(str(self.path), timeout=30, isolation_level=None,
+                                          check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, batch TEXT NOT NULL, position INTEGER NOT NULL, "
+            "name TEXT NOT NULL, state TEXT NOT NULL, stage TEXT NOT NULL, target TEXT NOT NULL, "
+            "data TEXT NOT NULL, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+            "owner TEXT, lease_until REAL, updated_at REAL NOT NULL, UNIQUE (batch, position))")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS jobs_batch_state ON jobs (batch, state)")
+
+    def _transaction(self, sql, params=()):
+        """在一个 IMMEDIATE 事务中执行 sql，返回游标"""
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = self.connection.execute(sql, params)
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        return cursor
+
+    @staticmethod
+    def batch_id(names, source=None):
+        """根据来源文件和歌曲列表生成批次 id，同一个列表再次提交时得到相同的 id"""
+        digest = hashlib.sha1(str(Path(source).resolve() if source else '').encode('utf-8'))
+        for name in names:
+            digest.update(b'\n' + name.encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+    @staticmethod
+    def reached(job, state):
+        """任务是否已完成 state 阶段"""
+        return states.index(job['stage']) >= states.index(state)
+
+    def add_batch(self, names, source=None, target='transcoded'):
+        """提交一批歌曲，已存在的任务保留原有进度
+
+        Args:
+            names (list): 歌曲名列表
+            source (Path): 歌曲列表的来源文件
+            target (str): 任务的最终阶段，不转码时为 downloaded
+
+        Returns:
+            tuple: (批次 id, 新增的任务数)
+        """
+        names = list(names)
+        batch = self.batch_id(names, source)
+        now = time.time()
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                added = 0
+                for position, name in enumerate(names):
+                    cursor = self.connection.execute(
+                        "INSERT OR IGNORE INTO jobs (batch, position, name, state, stage, target, data, updated_at) "
+                        "VALUES (?, ?, ?, 'queued', 'queued', ?, '{}', ?)", (batch, position, name, target, now))
+                    added += cursor.rowcount
+                self.connection.execute("UPDATE jobs SET target = ? WHERE batch = ?", (target, batch))
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        return batch, added
+
+    def claim(self, batch=None):
+        """领取一个未完成、未出错且没有被其他进程占用的任务
+
+        Returns:
+            dict: 任务字典，包含 job_id、name、stage 和之前保存的中间结果；没有可领取的任务时返回 None
+        """
+        now = time.time()
+        condition = "state != 'failed' AND stage != target AND (owner IS NULL OR lease_until < ?)"
+        params = [now]
+        if batch is not None:
+            condition += " AND batch = ?"
+            params.append(batch)
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.connection.execute(
+                    f"SELECT * FROM jobs WHERE {condition} ORDER BY batch, position LIMIT 1", params).fetchone()
+                if row is not None:
+                    self.connection.execute(
+                        "UPDATE jobs SET owner = ?, lease_until = ?, attempts = attempts + 1, updated_at = ? "
+                        "WHERE id = ?", (self.owner, now + self.lease, now, row['id']))
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return {**json.loads(row['data']), 'job_id': row['id'], 'name': row['name'],
+                'stage': row['stage'], 'target': row['target']}
+
+    def iter_claims(self, batch=None):
+        """逐个领取任务，直到没有可领取的任务为止；配合 Pipeline 使用时，只在上游有空位时才领取"""
+        while True:
+            job = self.claim(batch)
+            if job is None:
+                return
+            yield job
+
+    def heartbeat(self):
+        """为本进程持有的所有任务续期租约，返回续期的任务数"""
+        with self.lock:
+            return self._transaction(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ? AND lease_until IS NOT NULL",
+                (time.time() + self.lease, self.owner)).rowcount
+
+    def advance(self, job, state):
+        """记录任务完成了 state 阶段，保存中间结果并续期租约；到达最终阶段时释放任务
+
+        Raises:
+            RuntimeError: 租约已过期，任务已被其他进程领取
+        """
+        job['stage'] = state
+        data = {key: value for key, value in job.items() if key not in ('job_id', 'name', 'stage', 'target')}
+        now = time.time()
+        finished = state == job['target']
+        with self.lock:
+            updated = self._transaction(
+                "UPDATE jobs SET state = ?, stage = ?, data = ?, error = NULL, "
+                "owner = CASE WHEN ? THEN NULL ELSE owner END, lease_until = ?, updated_at = ? "
+                "WHERE id = ? AND owner = ?",
+                (state, state, json.dumps(data, ensure_ascii=False, default=str), finished,
+                 None if finished else now + self.lease, now, job['job_id'], self.owner)).rowcount
+        if not updated:
+            raise RuntimeError(f"任务 '{job['name']}' 的租约已过期，已被其他进程领取")
+
+    def fail(self, job, error):
+        """把任务标记为 failed 并释放，已完成阶段的中间结果保留；任务已被其他进程领取时不做修改"""
+        with self.lock:
+            return self._transaction(
+                "UPDATE jobs SET state = 'failed', error = ?, owner = NULL, lease_until = NULL, updated_at = ? "
+                "WHERE id = ? AND owner = ?", (str(error), time.time(), job['job_id'], self.owner)).rowcount > 0
+
+    def release(self, job):
+        """放弃已领取的任务（例如用户中断），任务保持原有进度，可以立即被重新领取"""
+        with self.lock:
+            self._transaction("UPDATE jobs SET owner = NULL, lease_until = NULL WHERE id = ? AND owner = ?",
+                              (job['job_id'], self.owner))
+
+    def retry_failed(self, batch=None):
+        """让出错的任务从最后完成的阶段重新开始，返回重置的任务数"""
+        sql = "UPDATE jobs SET state = stage, error = NULL WHERE state = 'failed'"
+        params = ()
+        if batch is not None:
+            sql += " AND batch = ?"
+            params = (batch,)
+        with self.lock:
+            return self._transaction(sql, params).rowcount
+
+    def recover(self):
+        """释放本机上已退出的进程领取的任务，返回释放的任务数
+
+        Windows 上无法安全地探测进程是否存在，只能等待租约过期。
+        """
+        if os.name == 'nt':
+            return 0
+        host = socket.gethostname()
+        with self.lock:
+            owners = [row['owner'] for row in self.connection.execute(
+                "SELECT DISTINCT owner FROM jobs WHERE owner LIKE ?", (f"{host}:%",))]
+        dead = []
+        for owner in owners:
+            pid = int(owner.rsplit(':', 1)[1])
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                dead.append(owner)
+            except PermissionError:
+                pass
+        if not dead:
+            return 0
+        with self.lock:
+            return self._transaction(
+                f"UPDATE jobs SET owner = NULL, lease_until = NULL WHERE owner IN ({','.join('?' * len(dead))})",
+                dead).rowcount
+
+    def counts(self, batch=None):
+        """各状态的任务数"""
+        sql = "SELECT state, COUNT(*) FROM jobs"
+        params = ()
+        if batch is not None:
+            sql += " WHERE batch = ?"
+            params = (batch,)
+        with self.lock:
+            return dict(self.connection.execute(sql + " GROUP BY state", params).fetchall())
+
+    def failures(self, batch=None):
+        """出错任务的 (歌曲名, 错误信息) 列表"""
+        sql = "SELECT name, error FROM jobs WHERE state = 'failed'"
+        params = ()
+        if batch is not None:
+            sql += " AND batch = ?"
+            params = (batch,)
+        with self.lock:
+            return [(row['name'], row['error']) for row in
+                    self.connection.execute(sql + " ORDER BY batch, position", params)]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def run_worker(batch=None, path=None, processes=1):
+    """作为独立的工作进程处理队列中的任务，可以同时启动多个；processes 大于 1 时使用多进程工作模式"""
+    # 延迟导入，只查看队列状态时不需要加载搜索和下载模块
+    import shutil
+    import download_mp4
+    import pipeline
+    import song_search
+    import transform
+    import worker_pool
+
+    if processes > 1:
+        print(worker_pool.run_workers(processes, batch=batch, queue_path=path).report())
+        return
+    config.set_logging()
+    jobs = JobQueue(path)
+    jobs.recover()
+    transformer = transform.Transform() if shutil.which('ffmpeg') else None
+    searcher = song_search.Song_Search()
+    summary = pipeline.process_jobs(jobs, searcher, download_mp4.download_mp4(), transformer, batch=batch)
+    print(summary.report())
+    if searcher.cache is not None:
+        searcher.cache.log_stats()
+    jobs.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量下载任务队列")
+    parser.add_argument("command", choices=["status", "worker", "retry"],
+                        help="status 查看各状态的任务数，worker 处理队列中的任务，retry 重置出错的任务")
+    parser.add_argument("--batch", default=None, help="只处理指定批次")
+    parser.add_argument("--path", default=None, help="队列文件路径")
+    parser.add_argument("--processes", type=int, default=1, help="worker 使用的进程数")
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        run_worker(args.batch, args.path, args.processes)
+        return
+    jobs = JobQueue(args.path)
+    if args.command == "retry":
+        print(f"{jobs.retry_failed(args.batch)} failed jobs will be retried.")
+    counts = jobs.counts(args.batch)
+    for state in states + ['failed']:
+        print(f"{state:<12}{counts.get(state, 0)}")
+    for name, error in jobs.failures(args.batch):
+        print(f"  ✗ {name}: {error}")
+    jobs.close()
+
+
+if __name__ == "__main__":
+    main()
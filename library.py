@@ -0,0 +1,140 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import config
+
+
+class MediaLibrary:
+    """本地媒体库
+
+    文件按内容的 sha256 保存在 root/<前两位>/<sha256>.<格式> 中，内容相同的文件只保存一份；
+    sqlite 索引记录 (bvid, cid, 格式) 到文件的对应关系，以及 av 号、标题、大小和入库时间。
+    不同视频的标题即使规范化后相同也不会互相覆盖。
+
+    Args:
+        root (Path): 媒体文件存放目录
+        index_path (Path): sqlite 索引文件路径
+    """
+
+    def __init__(self, root=None, index_path=None):
+        self.root = Path(root or config.library_dir)
+        self.index_path = Path(index_path or config.library_index)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        # 多个线程共用一个连接，访问由 self.lock 串行化
+        self.connection = sqlite3.connect(str(self.index_path), timeout=30, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS media ("
+                "bvid TEXT NOT NULL, aid INTEGER, cid INTEGER NOT NULL, format TEXT NOT NULL, "
+                "title TEXT, sha256 TEXT NOT NULL, path TEXT NOT NULL, size INTEGER NOT NULL, "
+                "added_at REAL NOT NULL, PRIMARY KEY (bvid, cid, format))")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS media_aid ON media (aid)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS media_sha256 ON media (sha256)")
+
+    @staticmethod
+    def file_hash(file_path, chunk_size=1024 * 1024):
+        """计算文件的 sha256"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _object_path(self, sha256, file_format):
+        return self.root / sha256[:2] / f"{sha256}.{file_format}"
+
+    def lookup(self, video_id, cid=None, file_format=None):
+        """查找已入库的文件，只读本地索引，不访问网络
+
+        Args:
+            video_id (str): BV 号或 "av<数字>"
+            cid (int): 分P的 cid，缺省时返回该视频任意一个分P
+            file_format (str): 文件格式（mp4/m4a/mp3 等），缺省时不限
+
+        Returns:
+            dict: 索引记录（bvid、aid、cid、format、title、sha256、path、size），没有时返回 None。
+            文件已被删除或大小不一致的记录会被清除。
+        """
+        if video_id[:2].lower() == "av":
+            conditions, params = ["aid = ?"], [int(video_id[2:])]
+        else:
+            conditions, params = ["bvid = ?"], [video_id]
+        if cid is not None:
+            conditions.append("cid = ?")
+            params.append(int(cid))
+        if file_format is not None:
+            conditions.append("format = ?")
+            params.append(file_format.lstrip('.').lower())
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT * FROM media WHERE {' AND '.join(conditions)} ORDER BY added_at DESC",
+                params).fetchall()
+            for row in rows:
+                record = dict(row)
+                path = Path(record['path'])
+                if path.is_file() and path.stat().st_size == record['size']:
+                    record['path'] = path
+                    return record
+                with self.connection:
+                    self.connection.execute(
+                        "DELETE FROM media WHERE bvid = ? AND cid = ? AND format = ?",
+                        (record['bvid'], record['cid'], record['format']))
+        return None
+
+    def add(self, file_path, bvid, aid, cid, title, file_format=None):
+        """把下载好的文件移入媒体库并写入索引
+
+        内容相同的文件已经在库中时，直接删除新文件，索引指向已有的文件。
+
+        Returns:
+            Path: 文件在媒体库中的路径
+        """
+        file_path = Path(file_path)
+        file_format = (file_format or file_path.suffix).lstrip('.').lower()
+        sha256 = self.file_hash(file_path)
+        size = file_path.stat().st_size
+        object_path = self._object_path(sha256, file_format)
+        with self.lock:
+            if object_path.is_file() and object_path.stat().st_size == size:
+                file_path.unlink()
+            else:
+                object_path.parent.mkdir(parents=True, exist_ok=True)
+                temp_path = object_path.with_name(object_path.name + '.tmp')
+                shutil.move(str(file_path), str(temp_path))
+                os.replace(temp_path, object_path)
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO media "
+                    "(bvid, aid, cid, format, title, sha256, path, size, added_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (bvid, aid, int(cid), file_format, title, sha256, str(object_path), size, time.time()))
+        return object_path
+
+    def remove(self, bvid, cid, file_format):
+        """删除一条索引记录，没有其他记录引用同一文件时一并删除文件"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT sha256, path FROM media WHERE bvid = ? AND cid = ? AND format = ?",
+                (bvid, int(cid), file_format)).fetchone()
+            if row is None:
+                return
+            with self.connection:
+                self.connection.execute(
+                    "DELETE FROM media WHERE bvid = ? AND cid = ? AND format = ?",
+                    (bvid, int(cid), file_format))
+            shared = self.connection.execute(
+                "SELECT COUNT(*) FROM media WHERE path = ?", (row['path'],)).fetchone()[0]
+            if not shared:
+                Path(row['path']).unlink(missing_ok=True)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
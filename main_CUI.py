@@ -1,18 +1,21 @@
 import configparser
 import os
+import shutil
 from pathlib import Path
-import time
 
 import requests
 
 import config
+import http_client
+import job_queue
 import song_search
+import pipeline
 import download_mp4
 import select_file
 import sys
-import logging
 
 import transform
+import worker_pool
 
 
 class main_CUI:
@@ -50,12 +53,7 @@ class main_CUI:
         print(f"Video '{video_title}' download complete!Saved to'{video_path}'")
 
     def set_logging(self):
-        config.logging_path.mkdir(exist_ok=True)
-        log_path = config.logging_path / "{}.log".format(str(time.time()))
-        logging.basicConfig(level=logging.INFO,
-                            format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-                            datefmt="%Y-%m-%d %H:%M:%S",
-                            filename=log_path)
+        config.set_logging()
 
     # def main():
     #     """The main function,which achieve the downloading of the designated video
@@ -76,6 +74,7 @@ class main_CUI:
     #     #Transform(video_path,mp3_path),用法已改！！！
 
     def batch_processing(self):
+        self.set_logging()
         # 修改1：使用不同的变量名避免冲突
         print("Please select a txt file in the window:")
         txt_path = select_file.select_file()
@@ -102,24 +101,32 @@ class main_CUI:
         total_songs = len(song_list)
         print(f"Found {total_songs} songs to process.")
 
-        for index, name in enumerate(song_list, 1):
-            try:
-                print(f"\nProcessing {index}/{total_songs}: {name}")
-
-                # 修改5：使用不同的变量名
-                video_id, video_title = self.search.filter_video(name)
-
-                print(f"Video starts downloading: {video_title}")
-
-                # 修改7：假设 video_prefix 是类的属性
-                video_url = self.video_prefix + video_id
-                self.downloader.download_video(bilibili_url=video_url)
-
-                print(f"Download completed for: {video_title}")
-
-            except Exception as e:
-                print(f"Error processing '{name}': {e}")
-                continue  # 继续处理下一首歌曲
+        # 修改5：搜索、解析、下载、转码分阶段并发执行，单首歌出错不影响其他歌曲
+        transformer = transform.Transform() if shutil.which('ffmpeg') else None
+        if transformer is None:
+            print("ffmpeg was not found, the downloaded videos will not be converted.")
+
+        # 修改6：任务记录在持久化队列中，中断后再次处理同一个文件时从每首歌最后完成的阶段继续
+        jobs = job_queue.JobQueue()
+        jobs.recover()
+        batch, added = jobs.add_batch(song_list, source=txt_path,
+                                      target='transcoded' if transformer else 'downloaded')
+        if added < total_songs:
+            retried = jobs.retry_failed(batch)
+            finished = jobs.counts(batch).get('transcoded' if transformer else 'downloaded', 0)
+            print(f"Resuming: {finished} of {total_songs} songs already finished, "
+                  f"{retried} failed songs will be retried.")
+        if config.batch_processes > 1:
+            # 修改7：多进程工作模式，下载和搜索解析在多个解释器中进行，不争用同一个 GIL
+            jobs.close()
+            summary = worker_pool.run_workers(config.batch_processes, batch=batch,
+                                              transcode=transformer is not None)
+        else:
+            summary = pipeline.process_jobs(jobs, self.search, self.downloader, transformer, batch=batch)
+            jobs.close()
+        print(summary.report())
+        if self.search.cache is not None:
+            self.search.cache.log_stats()
 
         print("\nBatch processing completed!")
 
@@ -146,7 +153,7 @@ class main_CUI:
 
     def download_by_url(self):
         bilibili_url = input("Please paste the url here:")
-        response = requests.get(bilibili_url, headers = config.headers, timeout = 5, stream = True)
+        response = http_client.get(bilibili_url, headers = config.headers, timeout = 5, stream = True)
         response.raise_for_status()
         print("The entered link has been verified as valid, starting the download.")
         video_title = self.downloader.download_video(bilibili_url=bilibili_url)
@@ -180,6 +187,7 @@ class main_CUI:
     def main(self):
         try:
             os.system("chcp 65001 >nul")
+            self.set_logging()
             self.clear_screen()
             self.self_check()
             while True:
@@ -1,8 +1,17 @@
+import re
 import sys
 import threading
+from pathlib import Path
+
+import config
 import download_mp4
-from PyQt5.QtCore import pyqtSignal, QObject
-from PyQt5.QtWidgets import QApplication, QMainWindow
+import song_search
+import stream_selector
+from downloading import DownloadManager
+from progress import QtProgressSink
+from PyQt5.QtCore import pyqtSignal, QObject, QRect, QRunnable, QThreadPool
+from PyQt5.QtWidgets import (QApplication, QHBoxLayout, QLabel, QMainWindow, QProgressBar, QPushButton,
+                             QScrollArea, QVBoxLayout, QWidget)
 
 from windows import Ui_MainWindow  # 导入自动生成的UI类
 
@@ -14,23 +23,290 @@ class DownloadSignals(QObject):
     finished = pyqtSignal()  # 完成后通知
 
 
-class DownloadThread(threading.Thread):
-    def __init__(self, url, signals):
+class DownloadTask(QRunnable):
+    """下载队列中的一个任务：搜索（输入不是视频链接时）→ 解析 → 下载 → 存入媒体库
+
+    state 依次为 queued → running → done / failed / paused / cancelled。
+    暂停会停止下载并保留已下载的部分，重新提交后从断点继续。
+    多P视频通过 download_mp4.download_all 一次下载全部分P，下载过程中不能暂停或取消。
+
+    Args:
+        user_input (str): 歌曲名、视频链接或 BV/AV 号
+        signals (DownloadSignals): 该任务的进度、状态和完成信号
+        downloader (download_mp4.download_mp4): 视频信息解析器，多个任务共用
+        searcher (song_search.Song_Search): 搜索器，多个任务共用
+        threads (int): 单个文件的下载线程数
+        audio_only (bool): 只下载音频流
+        on_finished (callable): run() 结束时以任务为参数调用，在下载线程中执行
+    """
+
+    def __init__(self, user_input, signals, downloader, searcher, threads=4, audio_only=True, on_finished=None):
         super().__init__()
-        self.url = url
+        # 任务对象由 DownloadQueue 持有，运行结束后不由线程池删除
+        self.setAutoDelete(False)
+        self.user_input = user_input
         self.signals = signals
+        self.downloader = downloader
+        self.searcher = searcher
+        self.threads = threads
+        self.audio_only = audio_only
+        self.on_finished = on_finished
+        self.state = 'queued'
+        self.title = None
+        self.path = None
+        self.manager = None
+        # run() 正在执行时为 True，此时由 DownloadManager.download() 自己清理分段文件
+        self.running = False
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        """取消任务并删除已下载的部分"""
+        with self.lock:
+            if self.state in ('done', 'failed', 'cancelled'):
+                return
+            self.state = 'cancelled'
+            self.stop_event.set()
+            if self.manager is None:
+                return
+            if self.running:
+                self.manager.cancel()
+            else:
+                # 已暂停或还在排队的任务没有线程在写入，直接删除之前下载的部分
+                self.manager.discard()
+
+    def pause(self):
+        """暂停任务，已下载的部分保留在 temp 目录中"""
+        with self.lock:
+            if self.state not in ('queued', 'running'):
+                return
+            self.state = 'paused'
+            self.stop_event.set()
+
+    def _resolve_video_id(self):
+        match = re.search(self.downloader.pattern, self.user_input)
+        if match is not None:
+            return match.group(0)
+        self.signals.status_updated.emit(f"正在搜索歌曲：{self.user_input}")
+        video_id, _ = self.searcher.filter_video(self.user_input, interactive=False)
+        return video_id
+
+    def _download_parts(self, video_id):
+        self.title = self.downloader.get_video_view(video_id)['title']
+        self.signals.status_updated.emit(f"正在下载全部分P：{self.title}")
+        results = self.downloader.download_all(video_id, audio_only=self.audio_only, include_season=False,
+                                               threads=self.threads)
+        paths = [path for _, path in results if path is not None]
+        self.path = paths[0] if paths else None
+        return len(paths) == len(results)
+
+    def _download(self):
+        video_id = self._resolve_video_id()
+        file_format = "m4a" if self.audio_only else "mp4"
+        record = self.downloader.find_in_library(video_id, file_format=file_format)
+        if record is not None:
+            self.title, self.path = record['title'], record['path']
+            return True
+        if len(self.downloader.get_parts(video_id, include_season=False)) > 1:
+            return self._download_parts(video_id)
+
+        aid, pic, self.title, cid = self.downloader.get_video_information(video_id)
+        self.signals.status_updated.emit(f"正在下载：{self.title}")
+        if self.audio_only:
+            stream = self.downloader.get_audio_stream(aid, cid)
+        else:
+            stream = self.downloader.get_mp4_stream(aid, cid)
+        urls = stream_selector.order_mirrors(stream['urls'])
+        filename = f"{config.normalize_filename(self.title)}.{file_format}"
+        # 始终开启续传，暂停后重新提交时从断点继续
+        manager = DownloadManager(urls[0], filename, threads=self.threads, resume=True,
+                                  progress_sinks=[QtProgressSink(self.signals)], stop_event=self.stop_event,
+                                  mirrors=urls[1:], stall_timeout=config.stall_timeout)
+        with self.lock:
+            if self.state != 'running':
+                return False
+            self.manager = manager
+        if not manager.download():
+            return False
+        bvid = self.downloader.get_video_view(video_id)['bvid']
+        self.path = self.downloader.library.add(Path(filename), bvid, aid, cid, self.title)
+        return True
 
     def run(self):
-        # 定义回调函数
-        def progress_callback(progress):
-            self.signals.progress_updated.emit(progress)
+        with self.lock:
+            if self.state != 'queued':
+                return
+            self.state = 'running'
+            self.running = True
+        error = None
+        try:
+            success = self._download()
+        except Exception as e:
+            success, error = False, e
+        with self.lock:
+            self.running = False
+            # 下载结束前后被取消时，download() 可能已经返回而没有清理
+            if self.state == 'cancelled' and self.manager is not None:
+                self.manager.discard()
+            if self.state == 'running':
+                self.state = 'done' if success else 'failed'
+            state = self.state
+        if state == 'done':
+            self.signals.progress_updated.emit(100)
+            self.signals.status_updated.emit(f"下载完成：{self.title}")
+        elif state == 'failed':
+            self.signals.status_updated.emit(f"下载失败：{error or self.title or self.user_input}")
+        elif state in ('paused', 'cancelled'):
+            self.signals.status_updated.emit(f"已{'暂停' if state == 'paused' else '取消'}：{self.title or self.user_input}")
+        if self.on_finished is not None:
+            self.on_finished(self)
+        self.signals.finished.emit()
 
-        def status_callback(status):
-            self.signals.status_updated.emit(status)
 
-        # 调用外部模块
-        download_mp4.download_video(self.url)
-        self.signals.finished.emit()
+class DownloadQueue:
+    """图形界面的下载队列，由 QThreadPool 限制同时运行的任务数
+
+    tasks 中只保留排队、运行和暂停的任务，结束（完成、失败或取消）的任务会被移除。
+
+    Args:
+        max_workers (int): 同时下载的任务数
+        threads (int): 单个文件的下载线程数
+    """
+
+    def __init__(self, max_workers=None, threads=None):
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(max_workers or config.gui_download_workers)
+        self.threads = threads or config.gui_download_threads
+        self.downloader = download_mp4.download_mp4()
+        self.searcher = song_search.Song_Search()
+        self.tasks = []
+        # 任务在下载线程中结束时从 tasks 移除，访问 tasks 需要加锁
+        self.lock = threading.Lock()
+
+    def _finished(self, task):
+        """任务结束后从 tasks 中移除，暂停的任务保留以便继续或取消"""
+        if task.state == 'paused':
+            return
+        with self.lock:
+            if task in self.tasks:
+                self.tasks.remove(task)
+
+    def submit(self, user_input, signals=None, audio_only=True, manager=None):
+        """加入一个下载任务，返回 DownloadTask
+
+        manager 为暂停前的下载管理器：新任务开始下载前被取消时，用它删除已下载的部分。
+        """
+        task = DownloadTask(user_input, signals or DownloadSignals(), self.downloader, self.searcher,
+                            threads=self.threads, audio_only=audio_only, on_finished=self._finished)
+        task.manager = manager
+        with self.lock:
+            self.tasks.append(task)
+        self.pool.start(task)
+        return task
+
+    def cancel(self, task):
+        # 还在排队的任务直接从线程池中移除
+        if self.pool.tryTake(task):
+            task.cancel()
+            self._finished(task)
+            task.signals.finished.emit()
+            return
+        task.cancel()
+        # 已暂停的任务没有下载线程，由这里通知任务结束；正在运行的任务由 run() 通知
+        if task.state == 'cancelled' and not task.running and task in self.tasks:
+            self._finished(task)
+            task.signals.finished.emit()
+
+    def pause(self, task):
+        if self.pool.tryTake(task):
+            task.state = 'paused'
+            task.signals.finished.emit()
+            return
+        task.pause()
+
+    def resume(self, task):
+        """重新提交暂停的任务，从断点继续下载"""
+        if task.state != 'paused' or task.running:
+            return task
+        with self.lock:
+            self.tasks.remove(task)
+        return self.submit(task.user_input, task.signals, task.audio_only, manager=task.manager)
+
+    def cancel_all(self):
+        with self.lock:
+            tasks = list(self.tasks)
+        for task in tasks:
+            self.cancel(task)
+
+    def wait(self, timeout=-1):
+        """等待所有任务结束"""
+        return self.pool.waitForDone(timeout)
+
+
+class DownloadTaskRow(QWidget):
+    """下载列表中的一行：任务名称、状态、进度条以及暂停/继续和取消按钮
+
+    继续下载时 DownloadQueue 会创建新的 DownloadTask，但沿用原来的 DownloadSignals，
+    所以每行只连接一次信号，按钮始终作用于 self.task 指向的当前任务。
+
+    Args:
+        download_queue (DownloadQueue): 任务所在的下载队列
+        user_input (str): 歌曲名、视频链接或 BV/AV 号
+        signals (DownloadSignals): 任务的信号，在提交任务之前连接，不会错过任务开始后立即发出的信号
+    """
+
+    def __init__(self, download_queue, user_input, signals, parent=None):
+        super().__init__(parent)
+        self.download_queue = download_queue
+        self.task = None
+        self.name_label = QLabel(user_input, self)
+        self.status_label = QLabel("排队中", self)
+        self.progress_bar = QProgressBar(self)
+        self.progress_bar.setValue(0)
+        self.pause_button = QPushButton("暂停", self)
+        self.cancel_button = QPushButton("取消", self)
+
+        controls = QHBoxLayout()
+        controls.addWidget(self.progress_bar)
+        controls.addWidget(self.pause_button)
+        controls.addWidget(self.cancel_button)
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.name_label)
+        layout.addWidget(self.status_label)
+        layout.addLayout(controls)
+
+        signals.progress_updated.connect(self.progress_bar.setValue)
+        signals.status_updated.connect(self.status_label.setText)
+        signals.finished.connect(self.on_task_finished)
+        self.pause_button.clicked.connect(self.on_pause_clicked)
+        self.cancel_button.clicked.connect(self.on_cancel_clicked)
+
+    def update_buttons(self):
+        """根据任务状态更新按钮：暂停中的任务要等下载线程退出后才能继续"""
+        state = self.task.state
+        self.pause_button.setText("继续" if state == 'paused' else "暂停")
+        self.pause_button.setEnabled(state in ('queued', 'running') or (state == 'paused' and not self.task.running))
+        self.cancel_button.setEnabled(state in ('queued', 'running', 'paused'))
+
+    def on_pause_clicked(self):
+        if self.task.state == 'paused':
+            self.task = self.download_queue.resume(self.task)
+            self.status_label.setText("排队中")
+        else:
+            self.download_queue.pause(self.task)
+        self.update_buttons()
+
+    def on_cancel_clicked(self):
+        self.download_queue.cancel(self.task)
+        self.update_buttons()
+
+    def on_task_finished(self):
+        # 排队时被暂停或取消的任务没有运行过，不会发出状态信息
+        if self.task.state == 'paused':
+            self.status_label.setText("已暂停")
+        elif self.task.state == 'cancelled':
+            self.status_label.setText("已取消")
+        self.update_buttons()
 
 
 class MusicPlayerApp(QMainWindow):
@@ -54,6 +330,9 @@ class MusicPlayerApp(QMainWindow):
         # 创建信号对象
         self.download_signals = DownloadSignals()
 
+        # 下载队列，同时下载的任务数由 config.gui_download_workers 限制
+        self.download_queue = DownloadQueue()
+
         # 初始化界面状态
         self.init_ui()
 
@@ -71,6 +350,15 @@ class MusicPlayerApp(QMainWindow):
         # 设置进度条初始值为0
         self.ui.progressBar.setValue(0)
 
+        # 窗口右侧的下载列表，每个任务一行（windows.py 由 windows.ui 生成，列表在这里创建）
+        self.task_area = QScrollArea(self.ui.centralwidget)
+        self.task_area.setGeometry(QRect(400, 30, 380, 500))
+        self.task_area.setWidgetResizable(True)
+        task_list = QWidget()
+        self.task_layout = QVBoxLayout(task_list)
+        self.task_layout.addStretch()
+        self.task_area.setWidget(task_list)
+
     def connect_signals(self):
         """连接信号和槽函数"""
         # 连接提交按钮的点击事件
@@ -91,15 +379,32 @@ class MusicPlayerApp(QMainWindow):
         self.ui.user_info.setVisible(True)
         self.update_user_info()
 
-        # 3. 禁用提交按钮，防止重复提交
-        self.ui.submitButton.setEnabled(False)
-
-        # 4. 重置进度条
+        # 3. 重置进度条
         self.ui.progressBar.setValue(0)
 
-        # 5. 启动下载线程
-        self.download_thread = DownloadThread(self.user_input, self.download_signals)
-        self.download_thread.start()
+        # 4. 加入下载队列，可以继续提交，超出并发数的任务排队等待；每个任务在下载列表中有一行
+        signals = DownloadSignals()
+        row = DownloadTaskRow(self.download_queue, self.user_input, signals)
+        self.task_layout.insertWidget(self.task_layout.count() - 1, row)
+        self.follow_task(signals)
+        row.task = self.download_queue.submit(self.user_input, signals)
+        row.update_buttons()
+
+    def follow_task(self, signals):
+        """窗口下方的进度条和提示只显示最近提交的任务，之前任务的信号与窗口全部断开"""
+        self.download_signals.progress_updated.disconnect(self.update_progress)
+        self.download_signals.status_updated.disconnect(self.update_user_info_text)
+        self.download_signals.finished.disconnect(self.on_download_finished)
+        self.download_signals = signals
+        self.download_signals.progress_updated.connect(self.update_progress)
+        self.download_signals.status_updated.connect(self.update_user_info_text)
+        self.download_signals.finished.connect(self.on_download_finished)
+
+    def closeEvent(self, event):
+        """关闭窗口时取消未完成的下载，并等待下载线程退出"""
+        self.download_queue.cancel_all()
+        self.download_queue.wait()
+        super().closeEvent(event)
 
     def update_user_info(self):
         """更新user_info标签的文本（使用预设的提示列表）"""
@@ -0,0 +1,346 @@
+import configparser
+import queue
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+import config
+import downloading
+import stream_selector
+import transcoding
+
+_STOP = object()
+
+
+class Stage:
+    """流水线中的一个阶段
+
+    Args:
+        name (str): 阶段名称
+        func (callable): 处理函数，接收一个任务字典并返回处理后的任务字典，出错时抛出异常
+        workers (int): 该阶段的并发线程数
+    """
+
+    def __init__(self, name, func, workers=1):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.completed = 0
+        self.failed = 0
+        self.busy_time = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, elapsed, success):
+        with self.lock:
+            self.busy_time += elapsed
+            if success:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+
+class PipelineSummary:
+    """流水线运行结果汇总"""
+
+    def __init__(self, stages, results, failures, elapsed):
+        self.stages = stages
+        self.results = results
+        self.failures = failures
+        self.elapsed = elapsed
+
+    def report(self):
+        """生成可直接打印的汇总文本"""
+        total = len(self.results) + len(self.failures)
+        lines = ["=" * 50,
+                 f"Processed {total} items in {self.elapsed:.1f}s: "
+                 f"{len(self.results)} succeeded, {len(self.failures)} failed"]
+        if self.elapsed > 0:
+            lines.append(f"Throughput: {len(self.results) / self.elapsed * 60:.1f} items/min")
+        for stage in self.stages:
+            handled = stage.completed + stage.failed
+            average = stage.busy_time / handled if handled else 0
+            lines.append(f"  {stage.name:<10} workers={stage.workers:<3} ok={stage.completed:<5} "
+                         f"failed={stage.failed:<5} avg={average:.2f}s")
+        for item, stage_name, error in self.failures:
+            lines.append(f"  ✗ {item.get('name')}: [{stage_name}] {error}")
+        lines.append("=" * 50)
+        return "\n".join(lines)
+
+
+class Pipeline:
+    """多阶段流水线
+
+    每个阶段有独立的线程池，阶段之间用有界队列连接：下游处理不过来时，
+    上游阶段在 put 时阻塞，从而形成背压，不会无限制地堆积任务。
+
+    Args:
+        stages (list): Stage 列表，按执行顺序排列
+        queue_size (int): 阶段之间队列的容量
+        on_finish (list): 所有阶段结束后依次调用的函数，用于释放阶段使用的资源（如转码调度器）
+    """
+
+    def __init__(self, stages, queue_size=8, on_finish=None):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.on_finish = list(on_finish or [])
+        self.results = []
+        self.failures = []
+        self.lock = threading.Lock()
+
+    def _stage_worker(self, stage, in_queue, out_queue):
+        while True:
+            item = in_queue.get()
+            if item is _STOP:
+                return
+            started = time.time()
+            try:
+                item = stage.func(item)
+            except Exception as e:
+                stage.record(time.time() - started, False)
+                with self.lock:
+                    self.failures.append((item, stage.name, e))
+                print(f"Error processing '{item.get('name')}' at {stage.name}: {e}")
+                continue
+            stage.record(time.time() - started, True)
+            if out_queue is None:
+                with self.lock:
+                    self.results.append(item)
+            else:
+                out_queue.put(item)
+
+    def run(self, items):
+        """处理所有任务，全部完成后返回 PipelineSummary"""
+        started = time.time()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        stage_threads = []
+        for index, stage in enumerate(self.stages):
+            out_queue = queues[index + 1] if index + 1 < len(self.stages) else None
+            threads = [threading.Thread(target=self._stage_worker, args=(stage, queues[index], out_queue),
+                                        name=f"{stage.name}-{n}", daemon=True)
+                       for n in range(stage.workers)]
+            for thread in threads:
+                thread.start()
+            stage_threads.append(threads)
+
+        for item in items:
+            queues[0].put(item)
+
+        # 逐级关闭：上一阶段的线程全部退出后，再通知下一阶段
+        for index, threads in enumerate(stage_threads):
+            for _ in threads:
+                queues[index].put(_STOP)
+            for thread in threads:
+                thread.join()
+        for callback in self.on_finish:
+            callback()
+
+        return PipelineSummary(self.stages, self.results, self.failures, time.time() - started)
+
+
+def load_pipeline_config(config_path=Path("config.ini")):
+    """读取各阶段并发数，config.ini 中 [pipeline] 段的值优先于 config.py 中的默认值
+
+    Returns:
+        tuple: (各阶段并发数字典, 队列容量)
+    """
+    workers = dict(config.pipeline_workers)
+    queue_size = config.pipeline_queue_size
+    parser = configparser.ConfigParser()
+    if config_path.exists():
+        try:
+            parser.read(config_path, encoding='utf-8')
+        except configparser.Error:
+            return workers, queue_size
+    if parser.has_section('pipeline'):
+        section = parser['pipeline']
+        for name in workers:
+            workers[name] = section.getint(f'{name}_workers', fallback=workers[name])
+        queue_size = section.getint('queue_size', fallback=queue_size)
+    return workers, queue_size
+
+
+def build_song_pipeline(searcher, downloader, transformer=None, workers=None, queue_size=None,
+                        audio_only=True, stream=False, job_queue=None, progress=None):
+    """创建批量下载歌曲的流水线：搜索 → 解析视频信息 → 下载 → 转码
+
+    stream 为 True 且提供了 transformer 时，下载和转码合并为一个阶段：
+    下载的数据直接通过管道写入 ffmpeg，不保存中间文件。
+
+    提供 job_queue 时，任务为 JobQueue 领取的任务字典：每个阶段完成后把中间结果写入队列，
+    已完成且结果仍然有效的阶段直接跳过，出错的任务在队列中标记为 failed。
+
+    Args:
+        searcher (song_search.Song_Search): 搜索器
+        downloader (download_mp4.download_mp4): 视频信息解析和下载器
+        transformer (transform.Transform): 转码器，为 None 时跳过转码阶段
+        workers (dict): 各阶段并发数，缺省使用 load_pipeline_config() 的结果
+        queue_size (int): 阶段之间队列的容量
+        audio_only (bool): 只下载 DASH 音频流（.m4a），不下载视频画面，下载量和转码开销都小得多
+        stream (bool): 边下载边转码
+        job_queue (job_queue.JobQueue): 持久化任务队列
+        progress (callable): 接收歌曲标题、返回进度输出端列表的函数，缺省不输出进度
+
+    Returns:
+        Pipeline: 任务为 {'name': 歌曲名} 字典的流水线
+    """
+    default_workers, default_queue_size = load_pipeline_config()
+    workers = {**default_workers, **(workers or {})}
+    queue_size = queue_size or default_queue_size
+
+    # 同一首歌在列表中出现多次（或不同标题规范化后相同）时，同一个文件同时只由一个线程写入
+    file_locks = {}
+    finished_files = {}
+    name_owners = {}
+    file_locks_lock = threading.Lock()
+
+    def file_lock(name):
+        with file_locks_lock:
+            return file_locks.setdefault(name, threading.Lock())
+
+    def output_name(item):
+        # 文件名使用标题；标题规范化后与另一个视频相同时才加上 cid，避免写入同一组分段文件
+        name = config.normalize_filename(item['title'])
+        with file_locks_lock:
+            owner = name_owners.setdefault(name, item['cid'])
+        return name if owner == item['cid'] else f"{name}_{item['cid']}"
+
+    def progress_sinks(item):
+        return progress(item['title']) if progress else []
+
+    def downloaded(item):
+        return bool(item.get('path')) and Path(item['path']).exists()
+
+    def resolved(item):
+        # 下载地址有时效，过期后需要重新解析
+        return downloaded(item) or time.time() - item.get('resolved_at', 0) < config.job_url_ttl
+
+    def transcoded(item):
+        return bool(item.get('output')) and Path(item['output']).exists()
+
+    def checkpoint(state, func, valid=None):
+        """把阶段的结果记录到任务队列，已完成的阶段不再重复执行"""
+        if job_queue is None:
+            return func
+
+        def run(item):
+            if job_queue.reached(item, state) and (valid is None or valid(item)):
+                return item
+            try:
+                item = func(item)
+            except Exception as e:
+                job_queue.fail(item, f"[{state}] {e}")
+                raise
+            job_queue.advance(item, state)
+            return item
+        return run
+
+    def search(item):
+        item['video_id'], item['title'] = searcher.filter_video(item['name'], interactive=False)
+        return item
+
+    def resolve(item):
+        aid, pic, title, cid = downloader.get_video_information(item['video_id'])
+        if audio_only:
+            stream, suffix = downloader.get_audio_stream(aid, cid), 'm4a'
+        else:
+            stream, suffix = dict(downloader.get_mp4_stream(aid, cid), codec=None), 'mp4'
+        # 延迟最低的镜像作为主地址，其余作为备用地址
+        urls = stream_selector.order_mirrors(stream['urls'])
+        item.update(aid=aid, cid=cid, title=title, url=urls[0], mirrors=urls[1:],
+                    codec=stream['codec'], suffix=suffix, resolved_at=time.time())
+        return item
+
+    def download(item):
+        filename = f"{output_name(item)}.{item['suffix']}"
+        with file_lock(filename):
+            # 重复的歌曲等前一个下载完成后直接使用同一个文件
+            if filename not in finished_files:
+                # 多首歌同时下载时默认不输出进度条，以免终端输出互相覆盖
+                if not downloading.download(item['url'], filename, progress_sinks=progress_sinks(item),
+                                            mirrors=item['mirrors'], stall_timeout=config.stall_timeout):
+                    raise RuntimeError("download failed")
+                finished_files[filename] = downloading.output_path(filename, mirrors=item['mirrors'])
+            item['path'] = finished_files[filename]
+        print(f"Download completed for: {item['title']}")
+        return item
+
+    def stream_transcode(item):
+        name = output_name(item)
+        with file_lock(name):
+            if name not in finished_files:
+                try:
+                    finished_files[name] = transformer.stream(item['url'], name, codec=item['codec'],
+                                                              progress_sinks=progress_sinks(item))
+                except subprocess.CalledProcessError as e:
+                    detail = "\n".join(e.stderr.strip().splitlines()[-5:])
+                    raise RuntimeError(f"ffmpeg exited with code {e.returncode}\n{detail}") from e
+            item['output'] = finished_files[name]
+        print(f"Download completed for: {item['title']}")
+        return item
+
+    def transcode(item):
+        source = str(item['path'])
+        with file_lock(source):
+            if source not in finished_files:
+                job = scheduler.submit(item['path'])
+                job.wait()
+                job.raise_for_status()
+                finished_files[source] = job.target_path
+            item['output'] = finished_files[source]
+        return item
+
+    stages = [
+        Stage('search', checkpoint('searched', search), workers['search']),
+        Stage('resolve', checkpoint('resolved', resolve, resolved), workers['resolve']),
+    ]
+    if stream and transformer is not None:
+        stages.append(Stage('stream', checkpoint('transcoded', stream_transcode, transcoded), workers['download']))
+        return Pipeline(stages, queue_size)
+
+    stages.append(Stage('download', checkpoint('downloaded', download, downloaded), workers['download']))
+    if transformer is not None:
+        # ffmpeg 进程由调度器统一限流，超时的任务会被结束并记录错误输出
+        scheduler = transcoding.TranscodeScheduler(transformer, max_workers=workers['transcode'])
+        stages.append(Stage('transcode', checkpoint('transcoded', transcode, transcoded), workers['transcode']))
+        # 流水线结束后停止调度器的工作线程
+        return Pipeline(stages, queue_size, on_finish=[scheduler.shutdown])
+    return Pipeline(stages, queue_size)
+
+
+def process_jobs(job_queue, searcher, downloader, transformer=None, batch=None, **kwargs):
+    """处理任务队列中可领取的任务，直到没有可领取的任务为止
+
+    任务在上游阶段有空位时才从队列中领取，多个进程同时调用时各自领取不同的任务。
+    运行期间后台线程每隔租约时长的 1/3 为本进程持有的任务续期，耗时较长的下载或转码不会被其他进程抢走。
+
+    Args:
+        job_queue (job_queue.JobQueue): 持久化任务队列
+        batch (str): 只处理指定批次，缺省处理所有批次
+        **kwargs: 传给 build_song_pipeline 的其他参数
+
+    Returns:
+        PipelineSummary: 本次运行的汇总
+    """
+    song_pipeline = build_song_pipeline(searcher, downloader, transformer, job_queue=job_queue, **kwargs)
+    stopped = threading.Event()
+
+    def heartbeat():
+        while not stopped.wait(job_queue.lease / 3):
+            try:
+                job_queue.heartbeat()
+            except Exception as e:
+                print(f"Failed to renew job leases: {e}")
+
+    heartbeat_thread = threading.Thread(target=heartbeat, name="job-heartbeat", daemon=True)
+    heartbeat_thread.start()
+    try:
+        summary = song_pipeline.run(job_queue.iter_claims(batch))
+    finally:
+        stopped.set()
+        heartbeat_thread.join()
+    # 没有 ffmpeg 时任务停在 downloaded，释放后可由能转码的进程继续
+    for item in summary.results:
+        if item['stage'] != item['target']:
+            job_queue.release(item)
+    return summary
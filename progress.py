@@ -0,0 +1,196 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+
+# 某一时刻的下载进度：已下载字节数、总字节数（未知时为 None）、平均速度（字节/秒）、
+# 预计剩余时间（秒，未知时为 None）、已用时间（秒）
+ProgressSnapshot = namedtuple('ProgressSnapshot', ['downloaded', 'total', 'speed', 'remaining', 'elapsed'])
+
+
+class ProgressCounter:
+    """单个工作线程的字节计数器
+
+    每个计数器只由一个线程写入，渲染线程只读取，因此不需要加锁。
+    """
+
+    def __init__(self):
+        self.value = 0
+
+    def add(self, length):
+        self.value += length
+
+
+class ProgressTracker:
+    """汇总各线程的下载字节数，并在后台线程中以固定频率推送给各个输出端
+
+    下载线程只需调用各自计数器的 add()，进度的计算和输出开销与下载速度无关。
+
+    Args:
+        total (int): 总字节数，未知时为 None
+        sinks (list): 输出端列表，每个输出端需实现 update(snapshot) 和 close(snapshot)
+        interval (float): 刷新间隔（秒），默认 0.1 秒即 10Hz
+        initial (int): 续传时已下载的字节数
+    """
+
+    def __init__(self, total, sinks=None, interval=0.1, initial=0):
+        self.total = total
+        self.sinks = [ConsoleProgressSink()] if sinks is None else list(sinks)
+        self.interval = interval
+        self.initial = initial
+        self.counters = []
+        self.start_time = None
+        self._counters_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def counter(self):
+        """为调用线程分配一个独立的计数器"""
+        counter = ProgressCounter()
+        with self._counters_lock:
+            self.counters.append(counter)
+        return counter
+
+    def value(self):
+        """当前已下载的总字节数（包括续传前已下载的部分）"""
+        return self.initial + sum(counter.value for counter in list(self.counters))
+
+    def snapshot(self):
+        downloaded = self.value()
+        elapsed = time.time() - self.start_time if self.start_time else 0
+        # 速度只统计本次下载的字节，不计入续传前的部分
+        speed = (downloaded - self.initial) / elapsed if elapsed > 0 else 0
+        remaining = None
+        if self.total and speed > 0 and downloaded < self.total:
+            remaining = (self.total - downloaded) / speed
+        return ProgressSnapshot(downloaded, self.total, speed, remaining, elapsed)
+
+    def _render_loop(self):
+        while not self._stopped.wait(self.interval):
+            self._emit('update')
+
+    def _emit(self, method):
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            try:
+                getattr(sink, method)(snapshot)
+            except Exception:
+                # 输出端出错不能影响下载
+                pass
+
+    def start(self):
+        """开始计时并启动渲染线程"""
+        self.start_time = time.time()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._render_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止渲染线程，输出最终进度并关闭各输出端"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._emit('update')
+        self._emit('close')
+
+
+class ConsoleProgressSink:
+    """命令行进度条"""
+
+    def __init__(self, bar_width=40, stream=None):
+        self.bar_width = bar_width
+        self.stream = stream or sys.stdout
+
+    def update(self, snapshot):
+        speed_str = f'{snapshot.speed / 1024 / 1024:.2f} MB/s'
+        if snapshot.total:
+            progress = min(snapshot.downloaded / snapshot.total, 1)
+            filled_length = int(self.bar_width * progress)
+            bar = '█' * filled_length + '-' * (self.bar_width - filled_length)
+            if snapshot.remaining is not None:
+                time_str = f"剩余: {snapshot.remaining:.1f}s"
+            else:
+                time_str = "剩余: 计算中..."
+            line = (f'\r[{bar}] {progress:.1%} | '
+                    f'{snapshot.downloaded:,}/{snapshot.total:,} | '
+                    f'{speed_str} | {time_str}')
+        else:
+            # 没有文件大小信息，只显示已下载量
+            line = f'\r已下载: {snapshot.downloaded:,} 字节 | 速度: {speed_str}'
+        self.stream.write(line)
+        self.stream.flush()
+
+    def close(self, snapshot):
+        self.stream.write('\n')
+        self.stream.flush()
+
+
+class QtProgressSink:
+    """把百分比进度通过 DownloadSignals.progress_updated 信号发送给界面，只在数值变化时发送"""
+
+    def __init__(self, signals):
+        self.signals = signals
+        self.last_percent = None
+
+    def update(self, snapshot):
+        if not snapshot.total:
+            return
+        percent = min(100, int(snapshot.downloaded * 100 / snapshot.total))
+        if percent != self.last_percent:
+            self.last_percent = percent
+            self.signals.progress_updated.emit(percent)
+
+    def close(self, snapshot):
+        pass
+
+
+class JsonProgressSink:
+    """每次刷新输出一行 JSON，供其他程序解析"""
+
+    def __init__(self, stream=None, name=None):
+        self.stream = stream or sys.stdout
+        self.name = name
+
+    def _write(self, event, snapshot):
+        record = {'event': event, 'name': self.name}
+        record.update(snapshot._asdict())
+        self.stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.stream.flush()
+
+    def update(self, snapshot):
+        self._write('progress', snapshot)
+
+    def close(self, snapshot):
+        self._write('finished', snapshot)
+
+
+class QueueProgressSink:
+    """把进度发送到 multiprocessing 队列，供父进程汇总显示
+
+    消息为 (事件, 名称, 进程号, ProgressSnapshot) 元组；进度消息最多每 interval 秒发送一次，
+    避免大量并发下载时队列被刷新消息占满。
+
+    Args:
+        channel (multiprocessing.Queue): 消息队列
+        name (str): 下载任务的名称
+        interval (float): 进度消息的最小间隔（秒）
+    """
+
+    def __init__(self, channel, name=None, interval=1.0):
+        self.channel = channel
+        self.name = name
+        self.interval = interval
+        self.pid = os.getpid()
+        self.last_sent = 0.0
+
+    def update(self, snapshot):
+        now = time.monotonic()
+        if now - self.last_sent >= self.interval:
+            self.last_sent = now
+            self.channel.put(('progress', self.name, self.pid, snapshot))
+
+    def close(self, snapshot):
+        self.channel.put(('finished', self.name, self.pid, snapshot))
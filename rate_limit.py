@@ -0,0 +1,197 @@
+import asyncio
+import configparser
+import email.utils
+import random
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import config
+
+# 主机名对应的接口类别，api.bilibili.com 再按路径细分
+host_classes = {
+    'search.bilibili.com': 'search',
+    'api.bilibili.com': 'api',
+    'www.bilibili.com': 'api',
+}
+api_paths = [
+    ('/search', 'search'),
+    ('/view', 'view'),
+    ('/playurl', 'playurl'),
+]
+cdn_suffixes = ('.bilivideo.com', '.bilivideo.cn', '.akamaized.net')
+
+
+def endpoint_class(url):
+    """请求地址所属的接口类别（search/view/playurl/api/cdn），不需要限流的地址返回 None"""
+    parts = urlsplit(url)
+    host = parts.hostname or ''
+    endpoint = host_classes.get(host)
+    if endpoint is None and host.endswith(cdn_suffixes):
+        endpoint = 'cdn'
+    if endpoint == 'api':
+        for fragment, name in api_paths:
+            if fragment in parts.path:
+                return name
+    return endpoint
+
+
+class TokenBucket:
+    """令牌桶：平均每秒 rate 个请求，最多连续突发 burst 个
+
+    令牌不足时按预约顺序排队，预约时即扣除令牌，等待时间由调用方自行 sleep，
+    因此线程和 asyncio 可以共用同一个令牌桶。
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """预约一个令牌，返回需要等待的秒数"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+
+class RetryPolicy:
+    """重试策略：指数退避加随机抖动（full jitter），服务器给出 Retry-After 时按其等待
+
+    Args:
+        attempts (int): 最多尝试次数（包括第一次）
+        base_delay (float): 第一次重试前的最大等待时间（秒）
+        max_delay (float): 单次等待时间的上限（秒）
+    """
+
+    # 412 和 -352/-412 是哔哩哔哩的风控响应，稍后重试通常可以恢复
+    retry_statuses = {412, 429, 500, 502, 503, 504}
+    retry_codes = {-352, -412, -509, -799}
+
+    def __init__(self, attempts=5, base_delay=0.5, max_delay=30.0):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt, retry_after=None):
+        """第 attempt 次（从 0 开始）失败后的等待时间，服务器要求的 Retry-After 同样不超过 max_delay"""
+        if retry_after is not None:
+            return min(self.max_delay, max(0.0, retry_after))
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    @staticmethod
+    def retry_after(response_headers):
+        """解析 Retry-After 头（秒数或 HTTP 日期），没有或无法解析时返回 None"""
+        value = (response_headers or {}).get('Retry-After')
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            return email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+
+    def should_retry(self, response, stream=False):
+        """判断 requests 的响应是否需要重试，流式响应不读取响应体"""
+        if response.status_code in self.retry_statuses:
+            return True
+        if stream or 'json' not in response.headers.get('Content-Type', ''):
+            return False
+        try:
+            return response.json().get('code') in self.retry_codes
+        except (ValueError, AttributeError):
+            return False
+
+
+def load_settings(config_path=Path("config.ini")):
+    """读取限流和重试参数，config.ini 中 [rate_limit] 与 [retry] 段的值优先于 config.py 中的默认值
+
+    Returns:
+        tuple: ({接口类别: (rate, burst)}, RetryPolicy)
+    """
+    limits = dict(config.rate_limits)
+    retry = dict(config.retry_policy)
+    parser = configparser.ConfigParser()
+    if config_path.exists():
+        try:
+            parser.read(config_path, encoding='utf-8')
+        except configparser.Error:
+            return limits, RetryPolicy(**retry)
+    if parser.has_section('rate_limit'):
+        section = parser['rate_limit']
+        for name, (rate, burst) in limits.items():
+            limits[name] = (section.getfloat(f'{name}_rate', fallback=rate),
+                            section.getint(f'{name}_burst', fallback=burst))
+    if parser.has_section('retry'):
+        section = parser['retry']
+        retry['attempts'] = section.getint('attempts', fallback=retry['attempts'])
+        retry['base_delay'] = section.getfloat('base_delay', fallback=retry['base_delay'])
+        retry['max_delay'] = section.getfloat('max_delay', fallback=retry['max_delay'])
+    return limits, RetryPolicy(**retry)
+
+
+_limits = None
+_policy = None
+_buckets = {}
+_lock = threading.Lock()
+
+
+def _load():
+    global _limits, _policy
+    if _limits is None:
+        with _lock:
+            if _limits is None:
+                _limits, _policy = load_settings()
+
+
+def configure(limits=None, policy=None):
+    """替换限流参数和重试策略（例如测试时），已创建的令牌桶会被丢弃"""
+    global _limits, _policy
+    _load()
+    with _lock:
+        if limits is not None:
+            _limits = dict(limits)
+            _buckets.clear()
+        if policy is not None:
+            _policy = policy
+
+
+def get_limiter(url):
+    """获取地址所属接口类别的共享令牌桶，不需要限流时返回 None"""
+    endpoint = endpoint_class(url)
+    if endpoint is None:
+        return None
+    _load()
+    if endpoint not in _limits:
+        return None
+    with _lock:
+        if endpoint not in _buckets:
+            _buckets[endpoint] = TokenBucket(*_limits[endpoint])
+        return _buckets[endpoint]
+
+
+def get_policy():
+    """全局共享的重试策略"""
+    _load()
+    return _policy
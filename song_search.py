@@ -1,44 +1,282 @@
+import difflib
+import html
+import logging
+import math
 import sys
 import time
+import unicodedata
 
 import select
 from bs4 import BeautifulSoup
 import requests
 import re
 import config
+import http_client
+from cache import SqliteCache
+from generate_params import generate_wrid, filter_table
+
+logger = logging.getLogger(__name__)
+
+def parse_duration(text):
+    """Convert "mm:ss" or "hh:mm:ss" into seconds."""
+    try:
+        seconds = 0
+        for part in text.strip().split(':'):
+            seconds = seconds * 60 + int(part)
+        return seconds
+    except (AttributeError, ValueError):
+        return None
+
+
+def parse_count(text):
+    """Convert play counts such as "8642", "12.3万" or "1.2亿" into integers."""
+    if isinstance(text, int):
+        return text
+    try:
+        text = text.strip()
+        if text.endswith('万'):
+            return int(float(text[:-1]) * 10000)
+        if text.endswith('亿'):
+            return int(float(text[:-1]) * 100000000)
+        return int(text)
+    except (AttributeError, ValueError):
+        return None
+
+
+class HtmlSearchBackend:
+    """Scrape the search.bilibili.com result page."""
+
+    name = 'html'
 
-class Song_Search:
     def __init__(self):
         self.keyword_url = 'https://search.bilibili.com/all?keyword='
         self.video_id_pattern = r'href="//www\.bilibili\.com/video/([^/]+)/'
         self.title_pattern = r'title="(.*?)">'
-        self.blacklist_word = ["纯享","循环"]
 
-    def search(self,prompt):
-        search_url = self.keyword_url + prompt
-        response = requests.get(url = search_url,headers=config.headers)
-        search_html = BeautifulSoup(response.text,'html.parser')
+    def parse(self, text):
+        """Extract id, title, duration and play count of every video card in the search page."""
+        search_html = BeautifulSoup(text,'html.parser')
+        candidates = []
+        for card in search_html.find_all('div', class_='bili-video-card'):
+            info = card.find('div', class_='bili-video-card__info--right')
+            if info is None:
+                continue
+            video_id = re.findall(self.video_id_pattern, str(info))
+            title_tag = info.find(attrs={'title': True})
+            if not video_id or title_tag is None:
+                continue
+            stats = card.find_all(class_='bili-video-card__stats--item')
+            duration = card.find(class_='bili-video-card__stats__duration')
+            candidates.append({
+                'video_id': video_id[0],
+                'title': title_tag['title'],
+                'duration': parse_duration(duration.get_text()) if duration else None,
+                'play': parse_count(stats[0].get_text()) if stats else None,
+            })
+        if candidates:
+            return candidates
+
+        # 页面结构变化时退回到只匹配标题和链接
         search_list = str(search_html.find_all('div', class_='bili-video-card__info--right'))
         video_title = re.findall(self.title_pattern, search_list)
         video_id = re.findall(self.video_id_pattern, search_list)
-        final_video_title = video_title[0:5]
-        final_video_id = video_id[0:5]
+        return [{'video_id': vid, 'title': title, 'duration': None, 'play': None}
+                for title, vid in zip(video_title, video_id)]
+
+    def fetch(self, keyword, page=1, page_size=20):
+        """Download the raw result page."""
+        search_url = self.keyword_url + requests.utils.quote(keyword)
+        if page > 1:
+            search_url += f"&page={page}"
+        response = http_client.get(url = search_url,headers=config.headers)
+        response.raise_for_status()
+        return response.text
+
+    def search(self, keyword, page=1, page_size=20):
+        # 网页每页的数量固定，只能截取
+        return self.parse(self.fetch(keyword, page, page_size))[:page_size]
+
+
+class JsonSearchBackend:
+    """Query the WBI signed JSON search API, which only returns the fields we need."""
+
+    name = 'json'
+
+    def __init__(self):
+        self.api_url = 'https://api.bilibili.com/x/web-interface/wbi/search/type'
+        self.home_url = 'https://www.bilibili.com'
+        self.tag_pattern = re.compile(r'<[^>]+>')
+
+    def _ensure_cookies(self):
+        """The search API rejects requests without the buvid3 cookie that the home page sets."""
+        session = http_client.get_session()
+        if 'buvid3' not in session.cookies:
+            http_client.get(self.home_url)
+
+    def parse(self, payload):
+        """Extract id, title, duration and play count from the API response."""
+        if payload.get('code') != 0:
+            raise RuntimeError(f"search api error {payload.get('code')}: {payload.get('message')}")
+        candidates = []
+        for result in (payload.get('data') or {}).get('result') or []:
+            if result.get('type', 'video') != 'video' or not result.get('bvid'):
+                continue
+            candidates.append({
+                'video_id': result['bvid'],
+                # 标题中的关键词带有 <em class="keyword"> 高亮标签
+                'title': html.unescape(self.tag_pattern.sub('', result.get('title', ''))),
+                'duration': parse_duration(result.get('duration')),
+                'play': parse_count(result.get('play')),
+            })
+        return candidates
+
+    def fetch(self, keyword, page=1, page_size=20):
+        """Call the API and return the decoded JSON."""
+        self._ensure_cookies()
+        params = {
+            'search_type': 'video',
+            # 签名时会去掉这些字符，请求中的值要与签名保持一致
+            'keyword': keyword.translate(filter_table),
+            'page': page,
+            'page_size': page_size,
+        }
+        w_rid, wts = generate_wrid(params)
+        params.update(w_rid=w_rid, wts=wts)
+        response = http_client.get(self.api_url, params=params, headers=config.headers)
+        response.raise_for_status()
+        return response.json()
+
+    def search(self, keyword, page=1, page_size=20):
+        return self.parse(self.fetch(keyword, page, page_size))
+
+
+search_backends = {
+    'json': JsonSearchBackend,
+    'html': HtmlSearchBackend,
+}
+
+
+def normalize_query(prompt):
+    """Normalize a search keyword so that trivially different spellings share a cache entry."""
+    return ' '.join(unicodedata.normalize('NFKC', prompt).lower().split())
+
+
+class Song_Search:
+    def __init__(self, backends=None, use_cache=True):
+        self.blacklist_word = ["纯享","循环"]
+        # 歌曲时长的合理范围（秒），超出范围的多为片段、合集或循环版本
+        self.song_duration_range = (90, 480)
+        # 按顺序尝试各个搜索后端，前一个失败或没有结果时使用下一个
+        self.backends = [search_backends[name]() for name in (backends or config.search_backends)]
+        self.cache = None
+        if use_cache:
+            self.cache = SqliteCache(config.cache_dir / "cache.sqlite", "search",
+                                     ttl=config.search_cache_ttl, max_entries=config.search_cache_entries)
+
+    def search_candidates(self, prompt, page=1, page_size=20):
+        """Search bilibili for videos.
+
+        Args:
+            prompt (str) :The search keyword, not URL encoded.
+            page (int) :The result page, starting from 1.
+            page_size (int) :The number of results per page.
+
+        Returns:
+            list :Dicts with video_id, title, duration (seconds) and play count,
+                in bilibili's own order. Unknown values are None.
+        """
+        cache_key = f"{normalize_query(prompt)}|{page}|{page_size}"
+        if self.cache is not None:
+            cached = self.cache.get(cache_key)
+            stats = self.cache.stats()
+            if cached is not None:
+                logger.info("Search cache hit for '%s' (hits=%d, misses=%d)", prompt, stats['hits'], stats['misses'])
+                return cached
+            logger.info("Search cache miss for '%s' (hits=%d, misses=%d)", prompt, stats['hits'], stats['misses'])
+
+        candidates = []
+        for backend in self.backends:
+            try:
+                candidates = backend.search(prompt, page, page_size)
+            except Exception as e:
+                print(f"Search backend '{backend.name}' failed: {e}")
+                continue
+            if candidates:
+                break
+        # 只缓存有结果的搜索，失败或空结果下次重新搜索
+        if candidates and self.cache is not None:
+            self.cache.set(cache_key, candidates)
+        return candidates
+
+    def search(self,prompt):
+        candidates = self.search_candidates(requests.utils.unquote(prompt))[0:5]
+        final_video_title = [candidate['title'] for candidate in candidates]
+        final_video_id = [candidate['video_id'] for candidate in candidates]
         return final_video_title,final_video_id
 
-    def filter_video(self, prompt,timeout=10):
-        """Get user input for song name and search for matching videos。"""
-        print("Please wait a moment, searching...")
-        encoded_prompt = requests.utils.quote(prompt)  # URL encode the search query
-        video_title, video_id = self.search(encoded_prompt)
-        # Find the best result (avoid "循环" and "纯享" versions)
+    def score_candidate(self, prompt, candidate, position=0):
+        """Score a search result, higher is better.
+
+        The score combines how well the title matches the prompt, blacklist words
+        in the title, whether the duration looks like a single song, the play count
+        and bilibili's own ranking.
+        """
+        title = candidate['title'].lower()
+        keyword = prompt.strip().lower()
+        score = difflib.SequenceMatcher(None, keyword, title).ratio()
+        if keyword and keyword in title:
+            score += 1.0
+        score -= 2.0 * sum(1 for word in self.blacklist_word if word in candidate['title'] and word not in prompt)
+        duration = candidate.get('duration')
+        if duration is not None:
+            shortest, longest = self.song_duration_range
+            if duration < shortest or duration > longest:
+                score -= 1.0
+        play = candidate.get('play')
+        if play:
+            score += 0.1 * math.log10(play + 1)
+        score -= 0.05 * position
+        return score
+
+    def rank(self, prompt, limit=5):
+        """Return ranked candidates for a song name without any user interaction.
+
+        Args:
+            prompt (str) :The song name, not URL encoded.
+            limit (int) :The maximum number of candidates to return.
+
+        Returns:
+            list :Candidate dicts (see search_candidates) with an extra "score",
+                best first.
+        """
+        # 复制一份再打分排序，避免修改缓存中的结果
+        candidates = [dict(candidate) for candidate in self.search_candidates(prompt)]
+        for position, candidate in enumerate(candidates):
+            candidate['score'] = self.score_candidate(prompt, candidate, position)
+        candidates.sort(key=lambda candidate: candidate['score'], reverse=True)
+        return candidates[:limit]
+
+    def filter_video(self, prompt,timeout=10,interactive=True):
+        """Get user input for song name and search for matching videos。
+
+        With interactive=False (or timeout<=0) the best ranked result is returned
+        immediately without printing the menu or waiting for input.
+        """
+        interactive = interactive and timeout > 0
+        if interactive:
+            print("Please wait a moment, searching...")
+        candidates = self.rank(prompt)
+        if not candidates:
+            raise LookupError(f"No video found for '{prompt}'")
+        video_title = [candidate['title'] for candidate in candidates]
+        video_id = [candidate['video_id'] for candidate in candidates]
+        # The candidates are ranked, so the best result (avoid "循环" and "纯享" versions) comes first
         best_index = 0
+        if not interactive:
+            return video_id[best_index], video_title[best_index]
 
-        for i in range(5):
-            current_title = video_title[i]
+        for i, current_title in enumerate(video_title):
             print(str(i + 1) + "." + current_title)
-            if self.blacklist_word not in current_title:
-                best_index = i
-                break
 
         print(f"Please enter a number to make a selection. If no selection is made, the optimal result will be automatically chosen after {timeout} seconds...")
         print(f"The best result is: {best_index + 1}.{video_title[best_index]}")
@@ -96,7 +334,7 @@ class Song_Search:
         print()
 
         # Determine final selection
-        if 1 <= user_choice <= 5:
+        if 1 <= user_choice <= len(video_title):
             final_choice = user_choice - 1
             print(f"已选择: {user_choice}.{video_title[final_choice]}")
         else:
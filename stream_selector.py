@@ -0,0 +1,106 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import http_client
+
+# 最近完成的下载的平均速度（字节/秒），target_time 策略在没有配置 stream_link_speed 时使用
+_measured_speed = None
+_speed_lock = threading.Lock()
+
+
+def record_throughput(size, seconds):
+    """记录一次下载的实际速度，与之前的测量值按指数移动平均合并
+
+    小文件的耗时主要是连接延迟，不能代表链路速度，小于 1 MB 的下载不记录。
+    """
+    global _measured_speed
+    if size < 1024 * 1024 or seconds <= 0:
+        return
+    with _speed_lock:
+        speed = size / seconds
+        _measured_speed = speed if _measured_speed is None else 0.7 * _measured_speed + 0.3 * speed
+
+
+def measured_link_speed():
+    """最近下载的平均速度（字节/秒），本进程还没有完成过下载时返回 None"""
+    return _measured_speed
+
+
+def estimate_size(stream, duration):
+    """按码率估算流的字节数，stream 中已有 size 时直接使用"""
+    if stream.get('size'):
+        return stream['size']
+    return int(stream.get('bandwidth', 0) * (duration or 0) / 8)
+
+
+def select_stream(streams, duration=None, policy=None, max_size=None, target_seconds=None, link_speed=None):
+    """按策略从同一类型（音频或视频）的多个流中选择一个
+
+    Args:
+        streams (list): 流列表，每个流至少包含 bandwidth（比特/秒），可选 size（字节）
+        duration (float): 时长（秒），用于估算文件大小
+        policy (str): max_bitrate 选码率最高的流；
+            size_cap 选估算大小不超过 max_size 的最高码率流；
+            target_time 选能在 target_seconds 秒内以 link_speed 下载完的最高码率流。
+            缺省使用 config.stream_policy
+        max_size (int): size_cap 策略的大小上限（字节）
+        target_seconds (float): target_time 策略的目标下载时间（秒）
+        link_speed (float): target_time 策略使用的下载速度（字节/秒），
+            缺省使用 config.stream_link_speed，未配置时使用 measured_link_speed() 的实测速度
+
+    Returns:
+        dict: 选中的流；没有流满足限制时返回码率最低的流，streams 为空时返回 None
+    """
+    if not streams:
+        return None
+    policy = policy or config.stream_policy
+    max_size = max_size or config.stream_max_size
+    target_seconds = target_seconds or config.stream_target_seconds
+    link_speed = link_speed or config.stream_link_speed or measured_link_speed()
+    ordered = sorted(streams, key=lambda stream: stream.get('bandwidth', 0), reverse=True)
+
+    if policy == 'size_cap' and max_size:
+        limit = max_size
+    elif policy == 'target_time' and target_seconds and link_speed:
+        limit = target_seconds * link_speed
+    else:
+        return ordered[0]
+    for stream in ordered:
+        if estimate_size(stream, duration) <= limit:
+            return stream
+    return ordered[-1]
+
+
+def measure_latency(url, timeout=3):
+    """请求第一个字节，返回耗时（秒），请求失败时返回 None"""
+    request_headers = dict(config.headers, Range='bytes=0-0')
+    started = time.perf_counter()
+    try:
+        # 只测一次延迟，失败的地址直接排到最后，不走 http_client 的自动重试
+        with http_client.get(url, headers=request_headers, stream=True, timeout=timeout,
+                             retry=False) as response:
+            response.raise_for_status()
+    except Exception:
+        return None
+    return time.perf_counter() - started
+
+
+def rank_mirrors(urls, timeout=3):
+    """并发测量各镜像的延迟，按延迟从低到高排序，测量失败的地址排在最后
+
+    Returns:
+        list: [(url, latency)]，latency 为 None 表示测量失败
+    """
+    urls = list(dict.fromkeys(url for url in urls if url))
+    if len(urls) < 2:
+        return [(url, None) for url in urls]
+    with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+        latencies = list(executor.map(lambda url: measure_latency(url, timeout), urls))
+    return sorted(zip(urls, latencies), key=lambda item: (item[1] is None, item[1] or 0))
+
+
+def order_mirrors(urls, timeout=3):
+    """按延迟排序后的地址列表，第一个为首选地址"""
+    return [url for url, _ in rank_mirrors(urls, timeout)]
@@ -0,0 +1,222 @@
+import os
+import queue
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+from transform import Transform
+
+_STOP = object()
+
+
+class TranscodeJob:
+    """一个转码任务
+
+    status 依次为 queued → running → done / failed / timeout / cancelled。
+    任务结束后 returncode 和 stderr 保存 ffmpeg 的退出码和错误输出。
+
+    Args:
+        file_path (Path): 输入文件
+        target_suffix (str): 目标格式，缺省使用转码策略中的 format
+        timeout (float): 超时时间（秒），None 表示不限制
+    """
+
+    def __init__(self, file_path, target_suffix=None, timeout=None):
+        self.file_path = Path(file_path)
+        self.target_suffix = target_suffix
+        self.timeout = timeout
+        self.status = 'queued'
+        self.target_path = None
+        self.copy = None
+        self.returncode = None
+        self.stderr = ''
+        self.elapsed = 0.0
+        self.process = None
+        self._cancel_requested = False
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def cancel(self):
+        """取消任务：排队中的任务直接跳过，运行中的任务会结束 ffmpeg 进程
+
+        Returns:
+            bool: 任务已结束时返回 False
+        """
+        with self._lock:
+            if self.status == 'queued':
+                self._finish('cancelled')
+                return True
+            if self.status == 'running':
+                self._cancel_requested = True
+                if self.process is not None:
+                    self.process.kill()
+                return True
+            return False
+
+    def _start(self, process):
+        """记录 ffmpeg 进程，任务已被取消时返回 False"""
+        with self._lock:
+            if self._cancel_requested:
+                process.kill()
+                return False
+            self.process = process
+            return True
+
+    def _finish(self, status):
+        self.status = status
+        self.process = None
+        self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """等待任务结束，超时返回 False"""
+        return self._done.wait(timeout)
+
+    def raise_for_status(self):
+        """任务没有成功完成时抛出 RuntimeError，附带 ffmpeg 错误输出的最后几行"""
+        if self.status == 'done':
+            return
+        detail = "\n".join(self.stderr.strip().splitlines()[-5:])
+        message = f"transcode {self.status}: {self.file_path.name}"
+        if self.returncode is not None:
+            message += f" (exit code {self.returncode})"
+        raise RuntimeError(f"{message}\n{detail}" if detail else message)
+
+
+class TranscodeScheduler:
+    """转码调度器：最多同时运行 max_workers 个 ffmpeg 进程，其余任务排队
+
+    下载完成后即可调用 submit() 加入队列，不必等待之前的转码结束。
+
+    Args:
+        transformer (transform.Transform): 用于生成 ffmpeg 命令，缺省按 config.ini 中的转码策略创建
+        max_workers (int): 同时运行的 ffmpeg 进程数，默认为 CPU 核心数
+        timeout (float): 每个任务的默认超时时间（秒），缺省使用转码策略中的 timeout
+    """
+
+    def __init__(self, transformer=None, max_workers=None, timeout=None):
+        self.transformer = transformer or Transform()
+        self.max_workers = max(1, max_workers or os.cpu_count() or 1)
+        self.timeout = timeout if timeout is not None else self.transformer.policy.get('timeout')
+        self.jobs = []
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._worker, name=f"transcode-{n}", daemon=True)
+                        for n in range(self.max_workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown(cancel=exc_type is not None)
+
+    def submit(self, file_path, target_suffix=None, timeout=None):
+        """加入一个转码任务
+
+        Returns:
+            TranscodeJob: 可用于等待、取消和查看结果
+        """
+        job = TranscodeJob(file_path, target_suffix, timeout if timeout is not None else self.timeout)
+        with self.lock:
+            self.jobs.append(job)
+        self.queue.put(job)
+        return job
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            if job is _STOP:
+                return
+            self._run(job)
+
+    def _run(self, job):
+        with job._lock:
+            if job.status != 'queued':
+                return
+            job.status = 'running'
+        started = time.time()
+        output_path = None
+        try:
+            command, output_path, job.target_path, job.copy = self.transformer.build_command(
+                job.file_path, job.target_suffix)
+            process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                       stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='ignore')
+        except OSError as e:
+            job.stderr = str(e)
+            job.elapsed = time.time() - started
+            with job._lock:
+                job._finish('failed')
+            return
+
+        status = None
+        if not job._start(process):
+            status = 'cancelled'
+        try:
+            _, job.stderr = process.communicate(timeout=job.timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            _, job.stderr = process.communicate()
+            status = 'timeout'
+        job.returncode = process.returncode
+        job.elapsed = time.time() - started
+
+        with job._lock:
+            if job._cancel_requested:
+                status = 'cancelled'
+            elif status is None:
+                status = 'done' if process.returncode == 0 else 'failed'
+            if status == 'done':
+                if output_path != job.target_path:
+                    os.replace(output_path, job.target_path)
+            elif output_path is not None:
+                # 不留下写了一半的输出文件
+                Path(output_path).unlink(missing_ok=True)
+            job._finish(status)
+
+    def join(self):
+        """等待已提交的全部任务结束，返回任务列表"""
+        with self.lock:
+            jobs = list(self.jobs)
+        for job in jobs:
+            job.wait()
+        return jobs
+
+    def cancel_all(self):
+        """取消所有未结束的任务"""
+        with self.lock:
+            jobs = list(self.jobs)
+        for job in jobs:
+            job.cancel()
+
+    def shutdown(self, wait=True, cancel=False):
+        """停止调度器
+
+        Args:
+            wait (bool): 是否等待工作线程退出
+            cancel (bool): 是否先取消未结束的任务
+        """
+        if cancel:
+            self.cancel_all()
+        for _ in self.threads:
+            self.queue.put(_STOP)
+        if wait:
+            for thread in self.threads:
+                thread.join()
+
+
+def transcode_all(paths, target_suffix=None, max_workers=None, timeout=None):
+    """并行转码多个文件，全部结束后返回任务列表，按 Ctrl-C 会取消剩余任务"""
+    with TranscodeScheduler(max_workers=max_workers, timeout=timeout) as scheduler:
+        jobs = [scheduler.submit(path, target_suffix) for path in paths]
+        for job in jobs:
+            job.wait()
+            if job.status == 'done':
+                print(f"Transcoded {job.file_path.name} -> {job.target_path.name} ({job.elapsed:.1f}s)")
+            else:
+                print(f"Failed to transcode {job.file_path.name}: {job.status}")
+    return jobs
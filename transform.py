@@ -1,18 +1,73 @@
+import configparser
+import json
 import webbrowser
 import subprocess
 import os
 import re
 import sys
-import requests
+import tempfile
 from bs4 import BeautifulSoup
 from pathlib import Path
 
 import config
 import downloading
-from select_file import select_file
+import http_client
+from progress import ProgressTracker
+
+# 各目标容器可以直接封装（不重新编码）的音频编码
+copy_codecs = {
+    'mp3': {'mp3'},
+    'm4a': {'aac', 'alac', 'mp3', 'ac3', 'eac3'},
+    'opus': {'opus'},
+    'ogg': {'vorbis', 'opus', 'flac'},
+    'flac': {'flac'},
+}
+
+# format = auto 时，各源编码对应的容器
+auto_suffix = {
+    'aac': 'm4a',
+    'alac': 'm4a',
+    'ac3': 'm4a',
+    'eac3': 'm4a',
+    'mp3': 'mp3',
+    'opus': 'opus',
+    'vorbis': 'ogg',
+    'flac': 'flac',
+}
+
+
+def load_transcode_config(config_path=Path("config.ini")):
+    """读取转码策略，config.ini 中 [transcode] 段的值优先于 config.py 中的默认值
+
+    Returns:
+        dict: 包含 format、quality、bitrate、copy、timeout 的字典
+    """
+    policy = {
+        'format': config.transcode_format,
+        'quality': config.transcode_quality,
+        'bitrate': config.transcode_bitrate,
+        'copy': config.transcode_copy,
+        'timeout': config.transcode_timeout,
+    }
+    parser = configparser.ConfigParser()
+    if config_path.exists():
+        try:
+            parser.read(config_path, encoding='utf-8')
+        except configparser.Error:
+            return policy
+    if parser.has_section('transcode'):
+        section = parser['transcode']
+        policy['format'] = section.get('format', fallback=policy['format']).lstrip('.').lower()
+        policy['quality'] = section.get('quality', fallback=policy['quality'])
+        policy['bitrate'] = section.get('bitrate', fallback=policy['bitrate'])
+        policy['copy'] = section.getboolean('copy', fallback=policy['copy'])
+        policy['timeout'] = section.getfloat('timeout', fallback=policy['timeout'])
+    return policy
+
 
 class Transform:
-    def __init__(self):
+    def __init__(self, policy=None):
+        self.policy = policy or load_transcode_config()
         self.temp_path = Path("./temp")
         self.default_installation_path = [
             r"C:\Program Files\7-Zip\7z.exe",
@@ -72,7 +127,7 @@ class Transform:
 
 
     def install_ffmpeg(self):
-        response = requests.get(url=self.ffmpeg_url, headers=config.headers)
+        response = http_client.get(url=self.ffmpeg_url, headers=config.headers)
         soup = BeautifulSoup(response.text, 'html.parser')
         ffmpeg_zip_element = soup.select_one(
             '#article-content > section:nth-child(2) > div.section-body > div:nth-child(1) > code:nth-child(2) > a:nth-child(1)')
@@ -90,19 +145,142 @@ class Transform:
             sys.exit(1)
         print("ffmpeg is installed successfully.")
 
-    def transform(self,file_path,target_suffix = "mp3"):
-        filename = Path(file_path).stem
-        target_path = self.temp_path / f"{filename}.{target_suffix}"
-        result = subprocess.run([
-            'ffmpeg', '-i', str(file_path),
-            '-q:a', '0', '-map', 'a',
-            str(target_path), '-y'],
+    def probe_audio_codec(self, file_path):
+        """用 ffprobe 读取第一条音轨的编码名称，ffprobe 不可用或读取失败时返回 None"""
+        try:
+            result = subprocess.run([
+                'ffprobe', '-v', 'error', '-select_streams', 'a:0',
+                '-show_entries', 'stream=codec_name', '-of', 'json', str(file_path)],
+                capture_output=True, text=True, encoding='utf-8',
+                errors='ignore', check=True)
+            streams = json.loads(result.stdout).get('streams') or []
+        except (OSError, subprocess.CalledProcessError, ValueError):
+            return None
+        return streams[0].get('codec_name') if streams else None
+
+    def encode_args(self, target_suffix):
+        """重新编码时的编码器参数"""
+        quality = self.policy['quality']
+        bitrate = self.policy['bitrate']
+        if target_suffix == 'mp3':
+            return ['-c:a', 'libmp3lame', '-q:a', quality]
+        if target_suffix == 'm4a':
+            return ['-c:a', 'aac', '-b:a', bitrate]
+        if target_suffix == 'opus':
+            return ['-c:a', 'libopus', '-b:a', bitrate]
+        if target_suffix == 'ogg':
+            return ['-c:a', 'libvorbis', '-q:a', quality]
+        if target_suffix == 'flac':
+            return ['-c:a', 'flac']
+        # 其他格式交给 ffmpeg 按扩展名选择默认编码器
+        return ['-q:a', quality]
+
+    def build_command(self, file_path, target_suffix=None, codec=None, name=None):
+        """根据转码策略生成 ffmpeg 命令
+
+        源音频编码可以直接放进目标容器时只复制音频流（-c:a copy），否则才重新编码。
+
+        Args:
+            file_path (Path): 输入文件，"pipe:0" 表示从标准输入读取
+            target_suffix (str): 目标格式，缺省使用策略中的 format
+            codec (str): 已知的源音频编码，缺省时用 ffprobe 读取（从管道读取时无法读取，视为未知）
+            name (str): 输出文件名（不含扩展名），缺省与输入文件同名
+
+        Returns:
+            tuple: (命令参数列表, ffmpeg 写入的路径, 最终输出文件路径, 是否为流复制)
+            输入和输出是同一个文件时（例如 .m4a 重新封装为 .m4a），ffmpeg 先写到临时文件，
+            完成后由调用方替换到最终路径。
+        """
+        target_suffix = (target_suffix or self.policy['format']).lstrip('.').lower()
+        if codec is None and not str(file_path).startswith('pipe:'):
+            codec = self.probe_audio_codec(file_path)
+        if target_suffix == 'auto':
+            target_suffix = auto_suffix.get(codec, 'mp3')
+        copy = self.policy['copy'] and codec in copy_codecs.get(target_suffix, ())
+        target_path = self.temp_path / f"{name or Path(file_path).stem}.{target_suffix}"
+        output_path = target_path
+        if target_path.resolve() == Path(file_path).resolve():
+            output_path = target_path.with_name(f"{target_path.stem}.transform{target_path.suffix}")
+        codec_args = ['-c:a', 'copy'] if copy else self.encode_args(target_suffix)
+        command = ['ffmpeg', '-i', str(file_path), '-map', '0:a:0', '-vn',
+                   *codec_args, str(output_path), '-y']
+        return command, output_path, target_path, copy
+
+    def transform(self,file_path,target_suffix = None):
+        command, output_path, target_path, copy = self.build_command(file_path, target_suffix)
+        result = subprocess.run(
+            command,
             capture_output=True, text=True, encoding='utf-8',
             errors='ignore', check=True)
+        if output_path != target_path:
+            os.replace(output_path, target_path)
+        print(f"{'Remuxed' if copy else 'Re-encoded'} {Path(file_path).name} -> {target_path.name}")
         return result
 
+    def stream(self, url, name, target_suffix=None, codec=None, chunk_size=64 * 1024, progress_sinks=None):
+        """边下载边转码：HTTP 响应体直接写入 ffmpeg 的标准输入，不在磁盘上保存中间文件
+
+        输入必须是可以顺序读取的格式（DASH 音频流、moov 在文件头的 mp4 等）。
+
+        Args:
+            url (str): 音视频流地址
+            name (str): 输出文件名（不含扩展名）
+            target_suffix (str): 目标格式，缺省使用策略中的 format
+            codec (str): 源音频编码，已知时才可能直接封装而不重新编码
+            chunk_size (int): 每次读取的字节数
+            progress_sinks (list): 进度输出端列表，默认为命令行进度条
+
+        Returns:
+            Path: 输出文件路径
+
+        Raises:
+            requests.exceptions.HTTPError: 请求失败
+            subprocess.CalledProcessError: ffmpeg 转码失败，stderr 中为 ffmpeg 的错误输出
+        """
+        command, output_path, target_path, copy = self.build_command(
+            'pipe:0', target_suffix, codec=codec, name=name)
+        self.temp_path.mkdir(exist_ok=True)
+        with http_client.get(url, headers=config.headers, stream=True) as response:
+            response.raise_for_status()
+            total = int(response.headers.get('content-length', 0)) or None
+            progress = ProgressTracker(total, progress_sinks)
+            counter = progress.counter()
+            # ffmpeg 的输出写到临时文件，避免管道写满后阻塞 ffmpeg
+            with tempfile.TemporaryFile() as stderr:
+                process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                           stderr=stderr)
+                progress.start()
+                try:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        process.stdin.write(chunk)
+                        counter.add(len(chunk))
+                    process.stdin.close()
+                except BrokenPipeError:
+                    # ffmpeg 提前退出，错误信息在 stderr 中
+                    pass
+                except BaseException:
+                    process.kill()
+                    process.wait()
+                    output_path.unlink(missing_ok=True)
+                    raise
+                finally:
+                    progress.stop()
+                returncode = process.wait()
+                if returncode != 0:
+                    output_path.unlink(missing_ok=True)
+                    stderr.seek(0)
+                    raise subprocess.CalledProcessError(
+                        returncode, command, stderr=stderr.read().decode('utf-8', errors='ignore'))
+        if output_path != target_path:
+            os.replace(output_path, target_path)
+        print(f"{'Remuxed' if copy else 'Re-encoded'} stream -> {target_path.name}")
+        return target_path
+
 
 if __name__ == "__main__":
+    # 文件选择窗口依赖 tkinter，只在直接运行时导入，无图形界面的工作进程也能导入本模块
+    from select_file import select_file
+
     try:
         transform = Transform()
         flag = transform.check_if_ffmpeg_exists()
@@ -112,7 +290,7 @@ if __name__ == "__main__":
                                 filetypes = [("Video File",config.video_suffix),
                                              ("Audio File",config.audio_suffix)])
         # 执行转换
-        transform.transform(file_path,target_suffix = ".mp3")
+        transform.transform(file_path)
     except subprocess.CalledProcessError:
         sys.exit("用户取消了选择，自动退出程序……")
     except Exception as e:
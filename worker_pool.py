@@ -0,0 +1,156 @@
+import multiprocessing
+import os
+import queue
+import shutil
+import time
+
+import config
+import job_queue
+import pipeline
+import progress
+import rate_limit
+
+
+def _split_limits(processes):
+    """每个进程使用的限流参数：各进程的令牌桶互相独立，按进程数平分总的请求速率"""
+    limits, _ = rate_limit.load_settings()
+    return {name: (rate / processes, max(1, burst // processes)) for name, (rate, burst) in limits.items()}
+
+
+def _worker_main(queue_path, batch, processes, channel, transcode, options):
+    """工作进程的入口：建立自己的搜索器、下载器和流水线，从任务队列中领取任务直到队列为空
+
+    结果和进度通过 channel 发送给父进程，异常对象可能无法在进程间传递，因此只发送文本。
+    """
+    # 在子进程中导入，BeautifulSoup 解析等 CPU 开销都在各自的解释器中进行
+    import download_mp4
+    import song_search
+    import transform
+
+    config.set_logging()
+    rate_limit.configure(limits=_split_limits(processes))
+    jobs = job_queue.JobQueue(queue_path)
+    transformer = transform.Transform() if transcode and shutil.which('ffmpeg') else None
+    # 转码进程数按工作进程平分，避免 ffmpeg 进程总数超过 CPU 核数
+    workers = {'transcode': max(1, (os.cpu_count() or 2) // processes)}
+    searcher = song_search.Song_Search()
+    try:
+        summary = pipeline.process_jobs(
+            jobs, searcher, download_mp4.download_mp4(), transformer, batch=batch,
+            workers=workers, progress=lambda name: [progress.QueueProgressSink(channel, name)], **options)
+    except Exception as e:
+        channel.put(('error', None, os.getpid(), str(e)))
+        return
+    finally:
+        jobs.close()
+        if searcher.cache is not None:
+            searcher.cache.log_stats()
+    channel.put(('summary', None, os.getpid(), {
+        'stages': [(stage.name, stage.workers, stage.completed, stage.failed, stage.busy_time)
+                   for stage in summary.stages],
+        'results': [{'name': item['name'], 'title': item.get('title'),
+                     'output': str(item.get('output') or item.get('path'))} for item in summary.results],
+        'failures': [({'name': item.get('name')}, stage_name, str(error))
+                     for item, stage_name, error in summary.failures],
+    }))
+
+
+class WorkerPool:
+    """多进程批量下载
+
+    启动 processes 个工作进程，每个进程运行一条完整的流水线（见 pipeline.process_jobs），
+    从同一个持久化任务队列中领取任务。下载、进度计算、文件合并和搜索结果的解析分散在多个解释器中，
+    不再争用同一个 GIL。工作进程通过 multiprocessing 队列把进度和结果发回父进程，父进程只负责汇总显示。
+
+    Args:
+        processes (int): 工作进程数，缺省使用 config.batch_processes
+        queue_path (Path): 任务队列文件路径，缺省使用 config.job_queue_path
+        transcode (bool): 是否转码（工作进程中找不到 ffmpeg 时跳过）
+        status_interval (float): 汇总状态的输出间隔（秒）
+        **options: 传给 build_song_pipeline 的其他参数，例如 audio_only、stream
+    """
+
+    def __init__(self, processes=None, queue_path=None, transcode=True, status_interval=5.0, **options):
+        self.processes = max(1, processes or config.batch_processes)
+        self.queue_path = queue_path or config.job_queue_path
+        self.transcode = transcode
+        self.status_interval = status_interval
+        self.options = options
+        self.active = {}
+
+    def _handle(self, message, stages, results, failures):
+        event, name, pid, payload = message
+        if event == 'progress':
+            self.active[(pid, name)] = payload
+        elif event == 'finished':
+            self.active.pop((pid, name), None)
+            print(f"✓ [{pid}] {name}: {payload.downloaded / 1024 / 1024:.2f} MB in {payload.elapsed:.1f}s")
+        elif event == 'error':
+            print(f"✗ Worker {pid} stopped: {payload}")
+        elif event == 'summary':
+            for stage_name, workers, completed, failed, busy_time in payload['stages']:
+                if stage_name in stages:
+                    stages[stage_name].workers += workers
+                else:
+                    stages[stage_name] = pipeline.Stage(stage_name, None, workers)
+                stage = stages[stage_name]
+                stage.completed += completed
+                stage.failed += failed
+                stage.busy_time += busy_time
+            results.extend(payload['results'])
+            failures.extend(payload['failures'])
+
+    def _print_status(self, jobs, batch):
+        speed = sum(snapshot.speed for snapshot in self.active.values())
+        counts = jobs.counts(batch)
+        finished = sum(counts.get(state, 0) for state in ('downloaded', 'transcoded'))
+        print(f"Workers: {self.processes} | downloading: {len(self.active)} | "
+              f"{speed / 1024 / 1024:.2f} MB/s | finished: {finished}/{sum(counts.values())} | "
+              f"failed: {counts.get('failed', 0)}")
+
+    def run(self, batch=None):
+        """处理队列中的任务，所有工作进程退出后返回 PipelineSummary"""
+        started = time.time()
+        # spawn 在各平台上行为一致，子进程不会继承父进程中的线程和 sqlite 连接
+        context = multiprocessing.get_context('spawn')
+        channel = context.Queue()
+        workers = [context.Process(target=_worker_main, name=f"download-worker-{n}",
+                                   args=(self.queue_path, batch, self.processes, channel, self.transcode,
+                                         self.options))
+                   for n in range(self.processes)]
+        for worker in workers:
+            worker.start()
+
+        jobs = job_queue.JobQueue(self.queue_path)
+        stages, results, failures = {}, [], []
+        last_status = time.time()
+        try:
+            while True:
+                try:
+                    self._handle(channel.get(timeout=0.5), stages, results, failures)
+                except queue.Empty:
+                    if not any(worker.is_alive() for worker in workers):
+                        break
+                if time.time() - last_status >= self.status_interval:
+                    last_status = time.time()
+                    self._print_status(jobs, batch)
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
+            raise
+        finally:
+            for worker in workers:
+                worker.join()
+            # 异常退出的工作进程领取的任务立即释放，下次运行时可以继续
+            jobs.recover()
+            jobs.close()
+
+        for worker in workers:
+            if worker.exitcode:
+                print(f"Worker {worker.pid} exited with code {worker.exitcode}")
+        return pipeline.PipelineSummary(list(stages.values()), results, failures, time.time() - started)
+
+
+def run_workers(processes=None, batch=None, queue_path=None, transcode=True, **options):
+    """启动多进程工作模式处理队列中的任务，返回 PipelineSummary"""
+    return WorkerPool(processes, queue_path, transcode, **options).run(batch)